@@ -0,0 +1,60 @@
+#########################################################################
+# Pico Guitar ADC integer arithmetic check (host PC)
+# FUNCTION:
+#   Compare the integer arithmetic pad state (ADC_Device_class.pad_state_integer)
+#   with the float arithmetic one (ADC_Device_class.pad_state) for all raw ADC
+#   values 0..65535, all velocity curves and some voltage gates.
+#   Gate states must be the same, and velocities must be within +/-1.
+# USAGE:
+#   python3 tools/adc_integer_check.py
+#########################################################################
+
+import sys
+
+from host_stubs import load_program
+
+GATES = [(800.0, 100.0), (400.0, 200.0), (100.0, 20.0), (1500.0, 600.0)]
+
+
+def main():
+    program = load_program()
+    adc = program.ADC_Device_class(program.A0, 'ADC0')
+    adc.integer_mode(True)
+
+    failed = 0
+    max_diff = 0
+    for curve_x10 in range(15, 41):
+        adc.velocity_curve(curve_x10 / 10.0)
+        for gate in GATES:
+            adc.voltage_gate(0, gate)
+            for raw in range(65536):
+                expect = adc.pad_state(gate, raw)
+                actual = adc.pad_state_integer(0, raw)
+                if (expect == program._ADC_RELEASED or expect == program._ADC_HOLD or
+                        actual == program._ADC_RELEASED or actual == program._ADC_HOLD):
+                    diff = 0 if expect == actual else 999
+                else:
+                    diff = abs(expect - actual)
+
+                if diff > max_diff:
+                    max_diff = diff
+
+                if diff > 1:
+                    failed = failed + 1
+                    if failed <= 10:
+                        print('NG: curve={:3.1f} gate={} raw={:d} float={:d} integer={:d}'.format(
+                            adc.velocity_curve(), gate, raw, expect, actual))
+
+    # Pitch bend value
+    for velocity in range(1, 128):
+        if abs((9000 + int((7000 / 127) * velocity)) - (9000 + (7000 * velocity) // 127)) > 1:
+            failed = failed + 1
+            print('NG: pitch bend velocity={:d}'.format(velocity))
+
+    print('MAX VELOCITY DIFF:', max_diff)
+    print('FAILED:', failed)
+    return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+#########################################################################
+# Pico Guitar raw ADC replay (host PC)
+# FUNCTION:
+#   Feed a raw ADC capture file recorded on Pico Guitar (ADC RECORD in
+#   the config3 screen, SYNTH/capture.bin) through ADC_Device_class.adc_handler
+#   with the whole pad-to-MIDI path, and capture the MIDI messages sent.
+#   The replay speed is reported in samples per second.
+# USAGE:
+#   python3 tools/adc_replay.py capture.bin [--save events.txt] [--expect events.txt]
+#                               [--repeat N] [--sleep] [--trace latency.bin]
+#   python3 tools/adc_replay.py --synthetic capture.bin
+#########################################################################
+
+import argparse
+import random
+import struct
+import sys
+import time
+
+import host_stubs
+from host_stubs import load_program, setup_program
+
+
+# Read a capture file: list of scans (msec from the previous scan, [(channel, raw), ...])
+def read_capture(file_name):
+    with open(file_name, 'rb') as f:
+        data = f.read()
+
+    if data[0:4] != b'PGA1':
+        raise ValueError('Not a Pico Guitar ADC capture file: ' + file_name)
+
+    count = struct.unpack_from('<I', data, 4)[0]
+    scans = []
+    for pos in range(8, 8 + count * 4, 4):
+        raw, channel, delta = struct.unpack_from('<HBB', data, pos)
+        if channel & 0x80 or len(scans) == 0:
+            scans.append((delta, []))
+
+        scans[-1][1].append((channel & 0x7f, raw))
+
+    return scans
+
+
+# Write a capture file
+def write_capture(file_name, scans):
+    records = bytearray()
+    count = 0
+    for delta, samples in scans:
+        first = True
+        for channel, raw in samples:
+            records.extend(struct.pack('<HBB', raw, channel | (0x80 if first else 0), delta if first else 0))
+            first = False
+            count = count + 1
+
+    with open(file_name, 'wb') as f:
+        f.write(b'PGA1')
+        f.write(struct.pack('<I', count))
+        f.write(records)
+
+
+# Make a synthetic capture: strikes on pads with noise, all pads sampled every 1 msec
+def synthetic_scans(seconds=10, seed=1):
+    rnd = random.Random(seed)
+    strikes = []
+    t = 100
+    while t < seconds * 1000 - 300:
+        pads = [rnd.randrange(8)] if rnd.random() < 0.7 else rnd.sample(range(6), rnd.randrange(2, 6))
+        for pad in pads:
+            strikes.append((t + rnd.randrange(3), pad, rnd.randrange(8000, 40000), rnd.randrange(30, 200)))
+
+        t = t + rnd.randrange(60, 250)
+
+    scans = []
+    for ms in range(seconds * 1000):
+        samples = []
+        for channel in (0, 1, 3, 2, 6, 7, 5, 4):
+            raw = rnd.randrange(200, 900)
+            for start, pad, peak, length in strikes:
+                if pad == channel and start <= ms < start + length:
+                    rise = ms - start
+                    level = peak * (rise + 1) // 4 if rise < 4 else peak * (length - rise) // (length - 4)
+                    raw = raw + (level if level < peak else peak)
+
+            samples.append((channel, raw if raw < 65536 else 65535))
+
+        scans.append((1, samples))
+
+    return scans
+
+
+# Analog input fed by the capture
+class ReplayAnalogIn:
+    def __init__(self, adc):
+        self._adc = adc
+        self.values = [0] * 8
+
+    @property
+    def value(self):
+        return self.values[self._adc._4051_channel]
+
+
+def replay(program, scans):
+    adc = program.adc0
+    analog_in = ReplayAnalogIn(adc)
+    adc._adc = analog_in
+    port = host_stubs.midi_ports[1]
+    port.events = []
+
+    samples = 0
+    start = time.perf_counter()
+    for delta, scan_samples in scans:
+        host_stubs.ticks.now = host_stubs.ticks.now + delta
+        for channel, raw in scan_samples:
+            analog_in.values[channel] = raw
+
+        samples = samples + len(scan_samples)
+        adc.adc_handler()
+        program.instrument_guitar.strum_step(host_stubs.ticks.now)		# Strum task
+        program.synth.midi_flush()			# MIDI output task
+
+    elapsed = time.perf_counter() - start
+    return (port.events, samples, elapsed)
+
+
+def event_lines(events):
+    return ['{:d} {}'.format(ticks, ' '.join('{:02x}'.format(b) for b in data)) for ticks, data in events]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a Pico Guitar raw ADC capture.')
+    parser.add_argument('capture', help='capture file (SYNTH/capture.bin)')
+    parser.add_argument('--save', help='save the MIDI messages in a text file')
+    parser.add_argument('--expect', help='compare the MIDI messages with a text file saved')
+    parser.add_argument('--repeat', type=int, default=1, help='replay N times for the benchmark')
+    parser.add_argument('--sleep', action='store_true', help='do sleep() in the program (real time)')
+    parser.add_argument('--trace', help='save the latency trace of the last replay (see latency_report.py)')
+    parser.add_argument('--synthetic', action='store_true', help='make a synthetic capture file and exit')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        write_capture(args.capture, synthetic_scans())
+        print('SYNTHETIC CAPTURE:', args.capture)
+        return 0
+
+    scans = read_capture(args.capture)
+    program = load_program()
+
+    # Every replay starts from a program just set up
+    total_samples = 0
+    total_elapsed = 0.0
+    for cnt in range(args.repeat):
+        setup_program(program, args.sleep)
+        if args.trace:
+            program.latency_tracer.enable(True)
+
+        (events, samples, elapsed) = replay(program, scans)
+        total_samples = total_samples + samples
+        total_elapsed = total_elapsed + elapsed
+
+    lines = event_lines(events)
+    print('SCANS   :', len(scans))
+    print('SAMPLES :', total_samples // args.repeat)
+    print('MIDI OUT: {:d} writes, {:d} bytes'.format(len(events), sum(len(data) for ticks, data in events)))
+    print('REPLAY  : {:.0f} samples/sec'.format(total_samples / total_elapsed if total_elapsed > 0 else 0.0))
+
+    if args.trace:
+        program.latency_tracer.enable(False)
+        program.latency_tracer.save(args.trace)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    if args.expect:
+        with open(args.expect, 'r') as f:
+            expected = f.read().split('\n')[:-1]
+
+        if expected != lines:
+            for i in range(max(len(expected), len(lines))):
+                a = expected[i] if i < len(expected) else '(none)'
+                b = lines[i] if i < len(lines) else '(none)'
+                if a != b:
+                    print('DIFFERENT at {:d}: expected "{}", replayed "{}"'.format(i, a, b))
+                    break
+
+            return 1
+
+        print('SAME AS:', args.expect)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
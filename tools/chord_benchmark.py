@@ -0,0 +1,84 @@
+#########################################################################
+# Pico Guitar chord output benchmark (host PC)
+# FUNCTION:
+#   Measure the time to issue a chord (pad 7) and the USB MIDI writes,
+#     BEFORE: one note at a time with a dummy NOTE-OFF and sleep(0.005)
+#             after each note (Guitar_class.play_chord before 1.1.0)
+#     AFTER : Guitar_class.play_chord, all notes in a single write
+# USAGE:
+#   python3 tools/chord_benchmark.py [--repeat N] [--no-sleep]
+#########################################################################
+
+import argparse
+import sys
+import time
+
+import host_stubs
+from host_stubs import load_program, setup_program
+
+
+# Guitar_class.play_chord(True) before the batched output
+def play_chord_per_note(program, velocity):
+    guitar = program.instrument_guitar
+    synth = program.synth
+    capo = guitar.capotasto()
+    channel = guitar.midi_channel()
+    count_nt = 0
+    for nt in guitar.chord_notes():
+        if nt >= 0:
+            synth.set_note_on(nt + capo, velocity, channel)
+            synth.midi_flush()
+            synth.midi_write(program._MIDI_NOTE_OFF, 0, 0, channel)
+            synth.midi_flush()
+            count_nt = count_nt + 1
+            program.sleep(0.005)
+
+    if count_nt % 2 == 1:
+        synth.midi_write(program._MIDI_NOTE_OFF, 0, 0, channel)
+        synth.midi_flush()
+
+
+def play_chord_batched(program, velocity):
+    program.instrument_guitar.play_chord(True, velocity)
+    program.synth.midi_flush()
+
+
+def benchmark(program, play, repeat):
+    port = host_stubs.midi_ports[1]
+    elapsed = 0.0
+    writes = 0
+    size = 0
+    for cnt in range(repeat):
+        port.events = []
+        start = time.perf_counter()
+        play(program, 100)
+        elapsed = elapsed + time.perf_counter() - start
+        writes = writes + len(port.events)
+        size = size + sum(len(data) for ticks, data in port.events)
+
+        # Notes off not to send NOTE-OFF before NOTE-ON in the next chord
+        program.instrument_guitar.play_chord(False)
+        program.synth.midi_flush()
+
+    return (elapsed * 1000.0 / repeat, writes / repeat, size / repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Pico Guitar chord output.')
+    parser.add_argument('--repeat', type=int, default=50, help='number of chords')
+    parser.add_argument('--no-sleep', action='store_true', help='do not sleep() in the program (CPU time only)')
+    args = parser.parse_args()
+
+    program = setup_program(load_program(), not args.no_sleep)
+    notes = len([nt for nt in program.instrument_guitar.chord_notes() if nt >= 0])
+    print('CHORD : {} ({:d} notes)'.format(program.instrument_guitar.chord_name()[1], notes))
+    print('              msec/chord  writes/chord  bytes/chord')
+    for name, play in (('BEFORE', play_chord_per_note), ('AFTER ', play_chord_batched)):
+        (msec, writes, size) = benchmark(program, play, args.repeat)
+        print('{}  {:14.3f}  {:12.1f}  {:11.1f}'.format(name, msec, writes, size))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#########################################################################
+# Pico Guitar packed chord table builder (host PC)
+# FUNCTION:
+#   Make SYNTH/MIDIFILE/chords.bin from SYNTH/MIDIFILE/chords.json,
+#   check that the packed table has the same frets as the JSON, and
+#   compare the heap and the lookup time,
+#     JSON : the chord dictionary (CHORD_DEFINITIONS['CM'][position][string])
+#     TABLE: Guitar_class.chord_fret() on the packed bytearray, and
+#            the index in the bytearray (as make_voicing() does)
+#   The numbers are for the host PC (CPython), compare the ratio.
+# USAGE:
+#   python3 tools/chord_table.py --out FILE [--count N]
+#########################################################################
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from host_stubs import ROOT_DIR, load_program, setup_program
+
+
+def heap_bytes(make):
+    tracemalloc.start()
+    obj = make()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (obj, size)
+
+
+def rate(count, func):
+    start = time.perf_counter()
+    for cnt in range(count):
+        func(cnt)
+
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Make the Pico Guitar packed chord table.')
+    parser.add_argument('--out', required=True, help='packed chord table file (SYNTH/MIDIFILE/chords.bin to update the one on PICO)')
+    parser.add_argument('--count', type=int, default=200000, help='number of lookups')
+    args = parser.parse_args()
+
+    program = load_program()
+    json_file = os.path.join(ROOT_DIR, program.CHORD_JSON_FILE)
+
+    # Make the table from the JSON always (not from an old packed file)
+    table_file = program.CHORD_TABLE_FILE
+    program.CHORD_TABLE_FILE = os.path.join(ROOT_DIR, 'SYNTH', 'MIDIFILE', 'no_such_folder', 'chords.bin')
+    program = setup_program(program)
+    guitar = program.instrument_guitar
+    program.CHORD_TABLE_FILE = table_file
+
+    with open(json_file, 'r') as f:
+        data = json.load(f)
+
+    # Same frets as the JSON
+    roots = guitar.PARAM_GUITAR_ROOTs
+    chords = guitar.PARAM_GUITAR_CHORDs
+    errors = 0
+    for root in range(12):
+        for chord in range(guitar._table_chords):
+            positions = data['CHORD_DEFINITIONS'][roots[root] + chords[chord]]
+            for position in range(2):
+                for string in range(6):
+                    if guitar.chord_fret(root, chord, position, string) != positions[position][string]:
+                        errors = errors + 1
+
+    if errors > 0:
+        print('DIFFERENT FRETS: {:d}'.format(errors))
+        return 1
+
+    if not guitar.save_chord_table(args.out):
+        print('NOT SAVED: ' + args.out)
+        return 1
+
+    # Load the packed file again
+    if not guitar.load_packed_chord_table(args.out):
+        print('BROKEN: ' + args.out)
+        return 1
+
+    print('SAVED   : {} ({:d} bytes, {:d} chords)'.format(args.out, os.path.getsize(args.out), guitar._table_chords))
+
+    # Heap of the tables
+    (json_data, json_heap) = heap_bytes(lambda: json.load(open(json_file, 'r')))
+    (packed, packed_heap) = heap_bytes(lambda: (bytearray(guitar._chord_table), list(chords[0:guitar._table_chords])))
+    print('HEAP    : JSON {:d} bytes, TABLE {:d} bytes ({:.1f}x smaller)'.format(json_heap, packed_heap, json_heap / packed_heap))
+
+    # Lookup a fret of each chord in turn
+    structure = json_data['CHORD_DEFINITIONS']
+    keys = [(root, chord, position, string) for root in range(12) for chord in range(guitar._table_chords) for position in range(2) for string in range(6)]
+
+    def json_lookup(cnt):
+        (root, chord, position, string) = keys[cnt % len(keys)]
+        return structure[roots[root] + chords[chord]][position][string]
+
+    def table_lookup(cnt):
+        (root, chord, position, string) = keys[cnt % len(keys)]
+        return guitar.chord_fret(root, chord, position, string)
+
+    # Index in the table as make_voicing() does
+    table = guitar._chord_table
+    indexes = [guitar.chord_table_index(root, chord, position) + string for (root, chord, position, string) in keys]
+
+    def index_lookup(cnt):
+        fret = table[indexes[cnt % len(keys)]]
+        return fret - 256 if fret >= 128 else fret
+
+    json_rate = rate(args.count, json_lookup)
+    table_rate = rate(args.count, table_lookup)
+    index_rate = rate(args.count, index_lookup)
+    print('LOOKUP  : JSON {:.0f}/sec, TABLE chord_fret() {:.0f}/sec ({:.1f}x), TABLE index {:.0f}/sec ({:.1f}x)'.format(json_rate, table_rate, table_rate / json_rate, index_rate, index_rate / json_rate))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+#########################################################################
+# CircuitPython stubs to run Pico Guitar code on a host PC (CPython)
+# FUNCTION:
+#   Install fake board/digitalio/analogio/supervisor/usb_midi/... modules
+#   into sys.modules, then load usb_midi_instrument.py without hardware.
+# USAGE:
+#   from host_stubs import load_program, setup_program
+#   program = setup_program(load_program())
+#########################################################################
+
+import builtins
+import importlib.util
+import os
+import sys
+import time
+import types
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Analog input: the value is set by the host program
+class AnalogIn:
+    def __init__(self, pin):
+        self.pin = pin
+        self.value = 0
+
+
+# Digital input/output pin
+class DigitalInOut:
+    def __init__(self, pin):
+        self.pin = pin
+        self.value = False
+        self.direction = None
+
+
+class Direction:
+    INPUT = 0
+    OUTPUT = 1
+
+
+# USB MIDI port: keeps all bytes written with the ticks
+class MIDIPort:
+    def __init__(self):
+        self.events = []
+
+    def write(self, buf, length=None):
+        if length is None:
+            length = len(buf)
+
+        self.events.append((ticks.ticks_ms(), bytes(buf[:length])))
+        return length
+
+
+# Millisecond ticks: real time unless the host program sets it
+class Ticks:
+    def __init__(self):
+        self.now = None
+
+    def ticks_ms(self):
+        if self.now is None:
+            return int(time.monotonic() * 1000) & ((1 << 29) - 1)
+
+        return self.now
+
+
+# SSD1306 OLED display which shows nothing
+class Display:
+    def fill(self, color):
+        pass
+
+    def fill_rect(self, x, y, w, h, color):
+        pass
+
+    def text(self, s, x, y, color, font_name=None, size=1):
+        pass
+
+    def show(self):
+        pass
+
+
+class _Any:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return _Any()
+
+    def __call__(self, *args, **kwargs):
+        return _Any()
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    for key, val in attrs.items():
+        setattr(module, key, val)
+
+    sys.modules[name] = module
+    return module
+
+
+ticks = Ticks()
+midi_ports = [MIDIPort(), MIDIPort()]
+
+
+def no_sleep(sec):
+    pass
+
+
+def install():
+    builtins.const = lambda val: val
+
+    pins = {}
+    for gp in range(29):
+        pins['GP' + str(gp)] = 'GP' + str(gp)
+
+    for a in range(4):
+        pins['A' + str(a)] = 'A' + str(a)
+
+    pins['LED'] = 'LED'
+    board = _module('board', **pins)
+    board.__all__ = list(pins.keys())
+
+    _module('digitalio', DigitalInOut=DigitalInOut, Direction=Direction)
+    _module('analogio', AnalogIn=AnalogIn)
+    _module('supervisor', ticks_ms=ticks.ticks_ms, runtime=types.SimpleNamespace(serial_bytes_available=0))
+    _module('usb_midi', ports=midi_ports)
+    _module('busio', I2C=_Any)
+    _module('keypad', Keys=_Any)
+    _module('adafruit_ssd1306', SSD1306_I2C=_Any)
+
+    lib_dir = os.path.join(ROOT_DIR, 'lib')
+    if lib_dir not in sys.path:
+        sys.path.insert(0, lib_dir)
+
+
+def load_program(file_name='usb_midi_instrument.py'):
+    install()
+    spec = importlib.util.spec_from_file_location('pico_guitar', os.path.join(ROOT_DIR, file_name))
+    program = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(program)
+    return program
+
+
+# Make the global objects like setup() in usb_midi_instrument.py (without the pad calibration)
+def setup_program(program, sleep=False):
+    os.chdir(ROOT_DIR)
+    if not sleep:
+        program.sleep = no_sleep
+
+    ticks.now = 0
+    program.pico_led = DigitalInOut(program.LED)
+    program.adc0 = program.ADC_Device_class(program.A0, 'ADC0')
+    program.scan_timing = program.Scan_Timing_class()
+    program.latency_tracer = program.Latency_Tracer_class()
+
+    program.display = program.OLED_SSD1306_class(None)
+    program.display.init_device(Display())
+    program.synth = program.USB_MIDI_Instrument_class()
+    program.input_device = program.Input_Devices_class(program.display)
+    program.instrument_guitar = program.Guitar_class(program.display)
+    program.application = program.Application_class(program.display)
+    program.application.setup()
+    program.synth.midi_flush()
+    midi_ports[1].events = []
+    return program
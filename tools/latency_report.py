@@ -0,0 +1,106 @@
+#########################################################################
+# Pico Guitar latency report (host PC)
+# FUNCTION:
+#   Summarize a latency trace file saved by Pico Guitar (LATENCY TRACE in
+#   the config3 screen, SYNTH/latency.bin) as percentile latencies of
+#     GATE -> RESOLVED: pad crosses the gate to notes resolved
+#     RESOLVED -> USB : notes resolved to NOTE-ON bytes written to USB
+#     GATE -> USB     : pad-to-USB latency
+# USAGE:
+#   python3 tools/latency_report.py latency.bin [--list]
+#########################################################################
+
+import argparse
+import struct
+import sys
+
+TRACE_GATE = 0
+TRACE_RESOLVED = 1
+TRACE_USB_WRITE = 2
+TRACE_US_PERIOD = 1 << 30
+
+POINT_NAMES = ('GATE', 'RESOLVED', 'USB')
+
+
+# Read a latency trace file: list of (usec, trace point, pad, MIDI status, MIDI data)
+def read_trace(file_name):
+    with open(file_name, 'rb') as f:
+        data = f.read()
+
+    if data[0:4] != b'PGL1':
+        raise ValueError('Not a Pico Guitar latency trace file: ' + file_name)
+
+    count = struct.unpack_from('<I', data, 4)[0]
+    return [struct.unpack_from('<IBBBB', data, pos) for pos in range(8, 8 + count * 8, 8)]
+
+
+def usec_diff(usec1, usec2):
+    return (usec1 - usec2) % TRACE_US_PERIOD
+
+
+# Pair the trace points of each note struck: [(pad, note, gate->resolved, resolved->usb, gate->usb), ...]
+# A gate is matched to the notes resolved on the pad, and a note resolved to the NOTE-ON written
+# with the same note and channel (the notes of several pads and strums are written in a flush).
+def strikes(events):
+    gate = [None] * 8
+    gate_sent = [False] * 8
+    resolved = {}
+    result = []
+    unmatched = 0
+    for usec, point, pad, status, data in events:
+        if point == TRACE_GATE and pad < 8:
+            if gate[pad] is not None and not gate_sent[pad]:
+                unmatched = unmatched + 1
+
+            gate[pad] = usec
+            gate_sent[pad] = False
+
+        elif point == TRACE_RESOLVED and pad < 8:
+            if gate[pad] is not None:
+                resolved[(status, data)] = (pad, gate[pad], usec)
+
+        elif point == TRACE_USB_WRITE and status & 0xf0 == 0x90 and (status, data) in resolved:
+            (pad, gate_usec, resolved_usec) = resolved.pop((status, data))
+            result.append((pad, data, usec_diff(resolved_usec, gate_usec), usec_diff(usec, resolved_usec), usec_diff(usec, gate_usec)))
+            gate_sent[pad] = True
+
+    for pad in range(8):
+        if gate[pad] is not None and not gate_sent[pad]:
+            unmatched = unmatched + 1
+
+    return (result, unmatched)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    rank = (len(values) * pct + 99) // 100
+    return values[rank - 1 if rank > 0 else 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a Pico Guitar latency trace.')
+    parser.add_argument('trace', help='latency trace file (SYNTH/latency.bin)')
+    parser.add_argument('--list', action='store_true', help='list all strikes')
+    args = parser.parse_args()
+
+    events = read_trace(args.trace)
+    (result, unmatched) = strikes(events)
+    print('EVENTS  :', len(events))
+    print('NOTES   :', len(result), '(gates without NOTE-ON: {:d})'.format(unmatched))
+    if len(result) == 0:
+        return 1
+
+    if args.list:
+        for pad, note, to_resolved, to_usb, total in result:
+            print('PAD {:d} NOTE {:3d}: {:6d} {:6d} {:6d} usec'.format(pad, note, to_resolved, to_usb, total))
+
+    print('usec              p50      p90      p99      max')
+    for column, name in ((2, 'GATE -> RESOLVED'), (3, 'RESOLVED -> USB '), (4, 'GATE -> USB     ')):
+        values = [strike[column] for strike in result]
+        print('{} {:8d} {:8d} {:8d} {:8d}'.format(name, percentile(values, 50), percentile(values, 90), percentile(values, 99), max(values)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
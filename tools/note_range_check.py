@@ -0,0 +1,89 @@
+#########################################################################
+# Pico Guitar MIDI note range check (host PC)
+# FUNCTION:
+#   Play the highest chords (13th chords on all roots in the high position,
+#   scale 8, capo +12) with the pads, the chord pad and a strum, then check
+#   that all MIDI data bytes written are 0..127 and no note is left on in
+#   the active notes bitset after the notes off (no note spills into the
+#   next channel).
+# USAGE:
+#   python3 tools/note_range_check.py
+#########################################################################
+
+import sys
+
+import host_stubs
+from host_stubs import load_program, setup_program
+
+
+# MIDI messages written: list of (status, data1, data2), data bytes out of 0..127 are counted in failed
+def midi_messages(failed):
+    messages = []
+    for usec, buf in host_stubs.midi_ports[1].events:
+        pos = 0
+        while pos < len(buf):
+            size = 2 if buf[pos] & 0xe0 == 0xc0 else 3
+            message = tuple(buf[pos:pos + size])
+            for data in message[1:]:
+                if data > 127:
+                    failed.append(message)
+
+            messages.append(message)
+            pos = pos + size
+
+    return messages
+
+
+def main():
+    program = setup_program(load_program())
+    synth = program.synth
+    guitar = program.instrument_guitar
+    chord = guitar.PARAM_GUITAR_CHORDs.index('13')
+
+    failed = []
+    played = 0
+    for channel in (0, 14):
+        for strum in (0, 20):
+            guitar.strum_spacing(strum)
+            for root in range(12):
+                guitar.value_guitar_root = root
+                guitar.value_guitar_chord = chord
+                guitar.value_guitar_on_note = -1
+                guitar.chord_position(1)
+                guitar.capotasto(12)
+                guitar.scale_number(8)
+
+                # Pads of the strings, the chord pad (and the strum) and the notes off
+                for string in range(6):
+                    guitar.play_a_string(string, 100, channel)
+
+                guitar.play_chord(True, 100, channel)
+                for step in range(7):
+                    host_stubs.ticks.now = host_stubs.ticks.now + strum
+                    guitar.strum_step(host_stubs.ticks.now)
+
+                synth.midi_flush()
+                for string in range(6):
+                    guitar.play_a_string(string, 0, channel)
+
+                guitar.play_chord(False, 0, channel)
+                synth.midi_flush()
+                played = played + 1
+
+                for ch in range(16):
+                    if synth.next_note_on(ch, 0) >= 0:
+                        failed.append(('NOTE LEFT ON', root, ch, synth.next_note_on(ch, 0)))
+
+    messages = midi_messages(failed)
+    notes_on = sum(1 for message in messages if message[0] & 0xf0 == 0x90 and message[2] > 0)
+    for message in failed[0:10]:
+        print('NG:', message)
+
+    print('CHORDS PLAYED:', played)
+    print('NOTE ON SENT :', notes_on)
+    print('FAILED:', len(failed))
+    return 1 if len(failed) > 0 or notes_on == 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
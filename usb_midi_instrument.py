@@ -72,6 +72,32 @@
 #            Drum set editor is available.
 #     1.0.8: 01/22/2025
 #            Music lyrics and strmming timing descriptions are available.
+#     1.1.0: 10/17/2026
+#            Raw ADC value to velocity lookup table.
+#            Integer arithmetic mode for ADC scanning.
+#            Scan 4051 channels in Gray code order with settle control.
+#            Adaptive pad scan, idle pads are sampled at a lower rate.
+#            Strike window to capture the peak velocity (config3 screen).
+#            Pad calibration at boot, saved in SYNTH/MIDIFILE/pads.json.
+#            Crosstalk rejection between pads.
+#            Pad state machine with retrigger holdoff (chattering filter).
+#            Raw ADC sample recorder for the host PC replay tool.
+#            Scan cycle timing histogram (debug screen and serial console).
+#            Pad-to-USB latency tracer.
+#            Allocation-free pad-to-note path, heap allocation accounting.
+#            Chord notes are sent in a single write without waits.
+#            Fast MIDI output without adafruit_midi message objects.
+#            Single MIDI writer coalescing the messages of all channels.
+#            Active note tracker per channel, all notes off and panic.
+#            Prioritized MIDI output queues written by an async task.
+#            Redundant controller message suppression and rate limiting.
+#            Timed strum (direction, spacing, velocity taper) in Configuration Mode4.
+#            Voice allocator with polyphony cap, voice steal, and let ring / mute.
+#            Chord voicing cache.
+#            Packed chord table (SYNTH/MIDIFILE/chords.bin) instead of the chord dictionary.
+#            Chord voicing generator for chord types not in the chord table (9, 11, 13, add11, slash chords).
+#            Chord name of the notes sounding on the Chord Play display (pitch classes index).
+#            Tunings (DROP D, DADGAD, OPEN G, SYNTH/MIDIFILE/tunings.json) in Configuration Mode4.
 #########################################################################
 
 import asyncio
@@ -80,16 +106,15 @@ import keypad
 from board import *
 import digitalio
 from busio import I2C			# for I2C
-from time import sleep
+from time import sleep, monotonic_ns
 import json
+import sys
+import gc
+import os
 
 import usb_midi					# for USB MIDI
-import adafruit_midi
-from adafruit_midi.control_change import ControlChange
 from adafruit_midi.note_off import NoteOff
 from adafruit_midi.note_on import NoteOn
-from adafruit_midi.pitch_bend import PitchBend
-from adafruit_midi.program_change import ProgramChange
 
 import board
 import supervisor
@@ -128,13 +153,98 @@ async def catch_pin_transitions(pin, pin_name, callback_pressed=None, callback_r
 ##########################################
 async def catch_adc_voltage(adc):
     while True:
-        adc.adc_handler()
+        start_ticks = supervisor.ticks_ms()
+        if scan_timing.alloc_accounting():
+            start_alloc = gc.mem_alloc()
+            adc.adc_handler()
+            scan_timing.add_alloc(_ALLOC_SCAN, gc.mem_alloc() - start_alloc)
+        else:
+            adc.adc_handler()
+
+        scan_timing.scan_cycle(start_ticks, supervisor.ticks_ms())
 
         # Gives away process time to the other tasks.
         # If there is no task, let give back process time to me.
         await asyncio.sleep(0.0)
 
 
+###################################
+# Write MIDI messages in async task
+###################################
+async def send_midi_output(synth_obj):
+    while True:
+        # All messages queued by the pads and the buttons are written at once in priority order
+        synth_obj.continuous_flush()
+        if synth_obj.midi_queued() > 0:
+            synth_obj.midi_flush()
+
+        # Gives away process time to the other tasks.
+        await asyncio.sleep(0.0)
+
+
+##################################
+# Play strum notes in async task
+##################################
+async def play_strum(guitar):
+    while True:
+        # Sleep until the next note of the strum, the pads are scanned meanwhile
+        wait = guitar.strum_step(supervisor.ticks_ms())
+        if wait > 0:
+            await asyncio.sleep_ms(wait)
+
+        # Gives away process time to the other tasks.
+        else:
+            await asyncio.sleep(0.0)
+
+
+##########################################################
+# Show the chord of the notes sounding in async task
+##########################################################
+async def show_sounding_chord(guitar):
+    while True:
+        # Sleep until the chord sounding can be shown again, the pads are scanned meanwhile
+        await asyncio.sleep_ms(guitar.sounding_chord_step(supervisor.ticks_ms()))
+
+
+##################################################
+# Catch commands from USB serial console in async task
+##################################################
+#   t: Dump the scan timing statistics
+#   r: Reset the scan timing statistics
+#   a: Heap allocation accounting on/off
+#   p: Panic (all notes off in all channels)
+#   i: Change the minimum interval of the continuous controllers
+async def catch_serial_command():
+    while True:
+        if supervisor.runtime.serial_bytes_available:
+            command = sys.stdin.read(1)
+            if   command == 't':
+                scan_timing.dump()
+                adc0.dump()
+                synth.midi_dump()
+
+            elif command == 'r':
+                scan_timing.reset()
+                adc0.counters_reset()
+                synth.controller_stats_reset()
+                print('SCAN TIMING: reset')
+
+            elif command == 'i':
+                val = synth.controller_interval() + 10
+                synth.controller_interval(val if val <= 50 else 0)
+                print('MIDI CONTROLLER INTERVAL: {:d}ms'.format(synth.controller_interval()))
+
+            elif command == 'p':
+                synth.panic()
+                print('MIDI PANIC')
+
+            elif command == 'a':
+                scan_timing.alloc_accounting(not scan_timing.alloc_accounting())
+                print('ALLOC ACCOUNTING: ' + ('ON' if scan_timing.alloc_accounting() else 'OFF'))
+
+        await asyncio.sleep(0.1)
+
+
 ########################
 ### OLED SSD1306 class
 ########################
@@ -199,6 +309,253 @@ class OLED_SSD1306_class:
 ################# End of OLED SSD1306 Class Definition #################
 
 
+#######################
+### Scan timing class
+#######################
+# Lower bounds (msec) of the histogram buckets, the last bucket has the longer durations
+SCAN_TIMING_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100)
+_SCAN_TIMING_SCAN = const(0)		# Duration of a scan cycle (adc_handler)
+_SCAN_TIMING_GAP = const(1)			# Gap between the end of a scan cycle and the beginning of the next one
+
+# Heap allocation accounting (gc.mem_alloc deltas)
+_ALLOC_SCAN = const(0)				# Bytes allocated in a scan cycle
+_ALLOC_NOTE = const(1)				# Bytes allocated in a note event (play_a_string, play_chord)
+
+class Scan_Timing_class:
+    def __init__(self):
+        # Bucket number for each msec up to the last bucket
+        last = SCAN_TIMING_BUCKETS[-1]
+        self._bucket_of = bytearray(last + 1)
+        bucket = 0
+        for msec in range(last + 1):
+            if bucket + 1 < len(SCAN_TIMING_BUCKETS) and msec >= SCAN_TIMING_BUCKETS[bucket + 1]:
+                bucket = bucket + 1
+
+            self._bucket_of[msec] = bucket
+
+        # Statistics for scan and gap: histogram, count, min, max, sum (msec), no allocation in scanning
+        self._histogram = ([0] * len(SCAN_TIMING_BUCKETS), [0] * len(SCAN_TIMING_BUCKETS))
+        self._count = [0, 0]
+        self._min = [0, 0]
+        self._max = [0, 0]
+        self._sum = [0, 0]
+        self._last_end_ticks = -1			# End of the last scan cycle (-1 is none)
+        self._reset_ticks = supervisor.ticks_ms()
+
+        # Heap allocation in scan cycles and note events: count, count allocating, max, sum (bytes)
+        self._alloc_accounting = False
+        self._alloc_count = [0, 0]
+        self._alloc_nonzero = [0, 0]
+        self._alloc_max = [0, 0]
+        self._alloc_sum = [0, 0]
+        self._gc_runs = 0					# Garbage collections seen (mem_alloc decreased)
+
+    def reset(self):
+        for kind in (_SCAN_TIMING_SCAN, _SCAN_TIMING_GAP):
+            histogram = self._histogram[kind]
+            for bucket in range(len(histogram)):
+                histogram[bucket] = 0
+
+            self._count[kind] = 0
+            self._min[kind] = 0
+            self._max[kind] = 0
+            self._sum[kind] = 0
+
+        for kind in (_ALLOC_SCAN, _ALLOC_NOTE):
+            self._alloc_count[kind] = 0
+            self._alloc_nonzero[kind] = 0
+            self._alloc_max[kind] = 0
+            self._alloc_sum[kind] = 0
+
+        self._gc_runs = 0
+        self._last_end_ticks = -1
+        self._reset_ticks = supervisor.ticks_ms()
+
+    def add(self, kind, msec):
+        if msec < 0:
+            msec = 0
+
+        count = self._count[kind]
+        if count == 0 or msec < self._min[kind]:
+            self._min[kind] = msec
+
+        if msec > self._max[kind]:
+            self._max[kind] = msec
+
+        self._count[kind] = count + 1
+        self._sum[kind] = self._sum[kind] + msec
+        bucket = self._bucket_of[msec] if msec < len(self._bucket_of) else self._bucket_of[-1]
+        self._histogram[kind][bucket] += 1
+
+    # Call at the end of each scan cycle with its start and end ticks
+    def scan_cycle(self, start_ticks, end_ticks):
+        self.add(_SCAN_TIMING_SCAN, ticks_diff(end_ticks, start_ticks))
+        if self._last_end_ticks >= 0:
+            self.add(_SCAN_TIMING_GAP, ticks_diff(start_ticks, self._last_end_ticks))
+
+        self._last_end_ticks = end_ticks
+
+    # Heap allocation accounting on/off (gc.mem_alloc is read around each scan cycle and note event)
+    def alloc_accounting(self, turn_on=None):
+        if turn_on is not None:
+            self._alloc_accounting = turn_on
+
+        return self._alloc_accounting
+
+    def add_alloc(self, kind, allocated):
+        # A garbage collection ran
+        if allocated < 0:
+            self._gc_runs = self._gc_runs + 1
+            return
+
+        self._alloc_count[kind] = self._alloc_count[kind] + 1
+        if allocated > 0:
+            self._alloc_nonzero[kind] = self._alloc_nonzero[kind] + 1
+            self._alloc_sum[kind] = self._alloc_sum[kind] + allocated
+            if allocated > self._alloc_max[kind]:
+                self._alloc_max[kind] = allocated
+
+    # Heap allocation statistics: (count, count allocating, mean, max) in bytes
+    def alloc_stats(self, kind):
+        count = self._alloc_count[kind]
+        return (count, self._alloc_nonzero[kind], (self._alloc_sum[kind] // count) if count > 0 else 0, self._alloc_max[kind])
+
+    # Statistics: (count, min, mean x10, max) in msec
+    def stats(self, kind):
+        count = self._count[kind]
+        return (count, self._min[kind], (self._sum[kind] * 10 // count) if count > 0 else 0, self._max[kind])
+
+    def histogram(self, kind):
+        return self._histogram[kind]
+
+    # Print the statistics to the USB serial console
+    def dump(self):
+        print('SCAN TIMING: {:d}ms since reset'.format(ticks_diff(supervisor.ticks_ms(), self._reset_ticks)))
+        for kind, name in ((_SCAN_TIMING_SCAN, 'SCAN'), (_SCAN_TIMING_GAP, 'GAP ')):
+            count, min_msec, mean10, max_msec = self.stats(kind)
+            print('{} count={:d} min={:d}ms mean={:d}.{:d}ms max={:d}ms'.format(name, count, min_msec, mean10 // 10, mean10 % 10, max_msec))
+
+        print('msec      SCAN       GAP')
+        for bucket in range(len(SCAN_TIMING_BUCKETS)):
+            if bucket + 1 == len(SCAN_TIMING_BUCKETS):
+                label = '{:d}-'.format(SCAN_TIMING_BUCKETS[bucket])
+            elif SCAN_TIMING_BUCKETS[bucket + 1] - 1 == SCAN_TIMING_BUCKETS[bucket]:
+                label = '{:d}'.format(SCAN_TIMING_BUCKETS[bucket])
+            else:
+                label = '{:d}-{:d}'.format(SCAN_TIMING_BUCKETS[bucket], SCAN_TIMING_BUCKETS[bucket + 1] - 1)
+
+            print('{:<7} {:>7d} {:>9d}'.format(label, self._histogram[_SCAN_TIMING_SCAN][bucket], self._histogram[_SCAN_TIMING_GAP][bucket]))
+
+        if self._alloc_accounting:
+            for kind, name in ((_ALLOC_SCAN, 'SCAN'), (_ALLOC_NOTE, 'NOTE')):
+                count, nonzero, mean, max_bytes = self.alloc_stats(kind)
+                print('ALLOC {} count={:d} allocating={:d} mean={:d}B max={:d}B'.format(name, count, nonzero, mean, max_bytes))
+
+            print('GC runs={:d}'.format(self._gc_runs))
+
+################# End of Scan Timing Class Definition #################
+
+
+##########################
+### Latency tracer class
+##########################
+# Latency trace file
+LATENCY_TRACE_FILE = 'SYNTH/latency.bin'
+
+# Trace points of a strike
+_TRACE_GATE = const(0)				# Pad crosses the gate (adc_handler)
+_TRACE_RESOLVED = const(1)			# A note resolved (play_a_string, play_chord)
+_TRACE_USB_WRITE = const(2)			# A note on handed to usb_midi.ports[1].write
+
+_TRACE_US_MASK = const((1 << 30) - 1)	# Timestamps in usec wrap around in 2^30 usec (small int)
+
+class Latency_Tracer_class:
+    def __init__(self, events=1024):
+        # Ring buffer of events, 8 bytes per event:
+        #   usec (30 bits, little endian 4 bytes), trace point, pad, MIDI status byte, MIDI data byte
+        self._events = events
+        self._buffer = bytearray(events * 8)
+        self._head = 0
+        self._count = 0
+        self._enabled = False
+        self._port = None
+
+    def enabled(self):
+        return self._enabled
+
+    def count(self):
+        return self._count
+
+    # Start or stop tracing, MIDI messages are written through this tracer while tracing
+    def enable(self, turn_on):
+        if turn_on:
+            self._head = 0
+            self._count = 0
+            self._port = usb_midi.ports[1]
+            synth.midi_out(self)
+        elif self._enabled:
+            synth.midi_out(self._port)
+
+        self._enabled = turn_on
+
+    # Add an event: pad (255 is unknown), MIDI status (note on and the channel) and data (note)
+    def trace(self, point, pad, status=0, data=0):
+        if not self._enabled:
+            return
+
+        usec = (monotonic_ns() // 1000) & _TRACE_US_MASK
+        buf = self._buffer
+        pos = self._head * 8
+        buf[pos]     = usec & 0xff
+        buf[pos + 1] = (usec >> 8) & 0xff
+        buf[pos + 2] = (usec >> 16) & 0xff
+        buf[pos + 3] = usec >> 24
+        buf[pos + 4] = point
+        buf[pos + 5] = pad
+        buf[pos + 6] = status
+        buf[pos + 7] = data & 0x7f
+        self._head = (self._head + 1) % self._events
+        if self._count < self._events:
+            self._count = self._count + 1
+
+    # MIDI output port interface for adafruit_midi.MIDI
+    def write(self, buf, num):
+        # An event for each note on in the messages written at once (notes of several pads and chords),
+        # the pad is found from the note and the channel by latency_report.py
+        pos = 0
+        while pos < num:
+            status = buf[pos]
+            if status & 0xf0 == _MIDI_NOTE_ON and pos + 1 < num:
+                self.trace(_TRACE_USB_WRITE, 255, status, buf[pos + 1])
+
+            # Program change and channel pressure are 2 bytes messages
+            pos = pos + (2 if status & 0xe0 == 0xc0 else 3)
+
+        return self._port.write(buf, num)
+
+    # Save the events in the time order
+    def save(self, file_name):
+        count = self._count
+        first = (self._head - count) % self._events
+        try:
+            with open(file_name, 'wb') as f:
+                f.write(b'PGL1')
+                f.write(bytes([count & 0xff, (count >> 8) & 0xff, (count >> 16) & 0xff, count >> 24]))
+                if first + count <= self._events:
+                    f.write(memoryview(self._buffer)[first * 8:(first + count) * 8])
+                else:
+                    f.write(memoryview(self._buffer)[first * 8:])
+                    f.write(memoryview(self._buffer)[0:self._head * 8])
+
+            return True
+
+        except Exception as e:
+#            print(e, file_name)
+            return False
+
+################# End of Latency Tracer Class Definition #################
+
+
 ###############
 ### ADC class
 ###############
@@ -220,6 +577,45 @@ def ticks_diff(ticks1, ticks2):
 #    "Return true iff ticks1 is less than ticks2, assuming that they are within 2**28 ticks"
 #    return ticks_diff(ticks1, ticks2) < 0
 
+# Raw ADC values are quantized to 12 bits (RP2040 ADC resolution) to index the lookup tables
+_ADC_TABLE_SHIFT = const(4)
+_ADC_TABLE_SIZE = const(65536 >> _ADC_TABLE_SHIFT)
+
+# Pad states in the lookup tables except velocity (1..127)
+_ADC_RELEASED = const(0)
+_ADC_HOLD = const(255)
+
+# 4051 channels in Gray code order, only one selector pin changes at each step (and 4 to 0)
+_4051_SCAN_ORDER = (0, 1, 3, 2, 6, 7, 5, 4)
+
+# Pad states
+_PAD_IDLE = const(0)				# Not tapped
+_PAD_ATTACK = const(1)				# Capturing the peak velocity in the strike window
+_PAD_HELD = const(2)				# Tapped (note on)
+_PAD_RELEASE = const(3)				# Signal dropped, waiting for the minimum release time
+_PAD_HOLDOFF = const(4)				# Released, no retrigger in the holdoff time
+
+# Margin ratio (%) added to the crosstalk coupling learned
+_CROSSTALK_MARGIN = const(5)
+
+# Coupling ratio (%) learned at most (a higher ratio is a pad tapped, not crosstalk)
+_CROSSTALK_LEARN_MAX = const(60)
+
+# The coupling learned decays by 1/2^this on each strike of the dominant pad
+_CROSSTALK_DECAY_SHIFT = const(4)
+
+# Raw ADC samples recorded
+ADC_CAPTURE_FILE = 'SYNTH/capture.bin'
+
+# A pad at rest (and not next to a pad played) is recorded only if its raw ADC value changes more than this
+_RECORD_CHANGE = const(1024)
+
+# Pad calibration file (noise peak raw ADC values of 8 pads at rest)
+PAD_CALIBRATION_FILE = 'SYNTH/MIDIFILE/pads.json'
+
+# Calibrated voltage gates are not lower than this ratio of the default gate (not to change the sensitivity too much)
+PAD_CALIBRATION_GATE_RATIO = 0.5
+
 class ADC_Device_class:
     def __init__(self, adc_pin, adc_name):
         self._adc = AnalogIn(adc_pin)
@@ -227,18 +623,66 @@ class ADC_Device_class:
         self._4051_selectors[0].direction = digitalio.Direction.OUTPUT
         self._4051_selectors[1].direction = digitalio.Direction.OUTPUT
         self._4051_selectors[2].direction = digitalio.Direction.OUTPUT
+        self._4051_channel = -1					# Channel selected now (-1 is unknown)
+        self._settle_delay = 0.0				# Wait time in seconds after changing the channel
+        self._discard_samples = 0				# Number of samples to discard after changing the channel
+        self._raw_values = [0] * 8				# Raw ADC values of 8 pads in the last scan
+        self._record_buffer = None				# Raw ADC samples recorded (None is not recording)
+        self._record_samples = 2048				# Samples to record (4 bytes of RAM each while recording)
+        self._record_count = 0
+        self._record_ticks = 0
+        self._record_last = [-1] * 8			# Raw ADC values recorded last
+        self._sampled = [True] * 8				# Pads sampled in the last scan
+
+        # Adaptive scan: active pads (tapped or over the off voltage) are sampled in every scan,
+        # idle pads are sampled once in the idle scan interval (worst case latency to detect a tap)
+        self._pad_active = [False] * 8
+        self._idle_scan_interval = 2			# msec (0 samples all pads in every scan)
+        self._idle_scan_ticks = 0
+
+        # Pad state machine: IDLE -> ATTACK -> HELD -> RELEASE -> HOLDOFF -> IDLE
+        self._pad_state = [_PAD_IDLE] * 8
+        self._state_ticks = [0] * 8				# Ticks at the beginning of the current state
+        self._min_held_time = 10				# msec to keep HELD even if the signal drops
+        self._min_release_time = 5				# msec in RELEASE to confirm the release (chattering filter)
+        self._holdoff_time = 20					# msec in HOLDOFF not to retrigger
+        self._holdoff_hit = [False] * 8			# Tapped in HOLDOFF already
+        self._chatter_suppressed = 0			# Number of retriggers suppressed in RELEASE
+        self._holdoff_suppressed = 0			# Number of retriggers suppressed in HOLDOFF
+
+        # Strike capture: a tapped pad is sampled in the strike window (ATTACK) to get the peak velocity
+        self._strike_window = 0					# msec (0 plays a note at the first sample over the on voltage)
+        self._strike_peak = [0] * 8				# Peak velocity in capturing
+
+        # Crosstalk rejection: a new trigger under the coupling ratio (%) of the dominant pad's raw ADC value is ignored
+        self._velocities = [0] * 8				# Pad states (velocity) in the last scan
+        self._crosstalk_ratio = 0				# Uniform coupling ratio (%) (0 is off)
+        self._crosstalk_learning = False		# Learn the coupling matrix while playing
+        self._crosstalk_learned = False			# Use the coupling matrix learned
+        self._crosstalk_coupling = bytearray(64)	# Coupling ratio (%) from pad [dominant * 8 + pad]
+        self._crosstalk_rejected = 0			# Number of triggers rejected
 
         self._adc_name = adc_name
         self._note_on = [False] * 7				# 6 strings on guitar, and effector
         self._play_chord = False
 #        self._voltage_gate = [(400.0,200.0)] * 8		# for Resistor elements
         self._voltage_gate = [(800.0,100.0)] * 8		# for Resistor elements
+        self._default_gate = self._voltage_gate[0]
+        self._noise_raw = None					# Noise peak raw ADC values of 8 pads at rest (None is not calibrated)
         self._adc_on = [False] * 8
         self._velocity_curve = 2.7
         self._on_counter = [0.0] * 8
         self._after_touch_count = 1000
         self._after_touched = False
 
+        # Raw ADC value to pad state lookup tables (one table per pad, pads with the same gate share it)
+        self._velocity_table = [None] * 8
+
+        # Integer arithmetic mode uses raw ADC value thresholds instead of the lookup tables
+        self._integer_mode = False
+        self._integer_gate = [None] * 8
+        self.make_velocity_tables()
+
     def adc(self):
         return self._adc
 
@@ -251,6 +695,118 @@ class ADC_Device_class:
             
         return self._after_touch_count
 
+    # Minimum time in msec to keep a pad HELD
+    def min_held_time(self, msec=None):
+        if msec is not None:
+            self._min_held_time = msec if msec > 0 else 0
+
+        return self._min_held_time
+
+    # Minimum time in msec to confirm a release
+    def min_release_time(self, msec=None):
+        if msec is not None:
+            self._min_release_time = msec if msec > 0 else 0
+
+        return self._min_release_time
+
+    # Time in msec not to retrigger a pad after releasing
+    def holdoff_time(self, msec=None):
+        if msec is not None:
+            self._holdoff_time = msec if msec > 0 else 0
+
+        return self._holdoff_time
+
+    # Numbers of retriggers suppressed (in RELEASE, in HOLDOFF)
+    def retrigger_suppressed(self):
+        return (self._chatter_suppressed, self._holdoff_suppressed)
+
+    # Change a pad state
+    def set_pad_state(self, pad, state, ticks):
+        self._pad_state[pad] = state
+        self._state_ticks[pad] = ticks
+
+    # Pad state machine, returns a velocity to play:
+    #   _ADC_RELEASED: Release the pad
+    #   _ADC_HOLD    : Do nothing
+    #   1..127       : Tap the pad (or after touch if the pad is on)
+    def pad_event(self, pad, velocity, current_ticks):
+        state = self._pad_state[pad]
+        elapsed = ticks_diff(current_ticks, self._state_ticks[pad])
+        tapped = velocity != _ADC_RELEASED and velocity != _ADC_HOLD
+
+        # No retrigger in the holdoff time
+        if state == _PAD_HOLDOFF:
+            if elapsed < self._holdoff_time:
+                if tapped and not self._holdoff_hit[pad]:
+                    self._holdoff_hit[pad] = True
+                    self._holdoff_suppressed = self._holdoff_suppressed + 1
+
+                return _ADC_HOLD
+
+            state = _PAD_IDLE
+            self.set_pad_state(pad, state, current_ticks)
+
+        # Tapped newly
+        if state == _PAD_IDLE:
+            if not tapped:
+                return _ADC_HOLD
+
+            latency_tracer.trace(_TRACE_GATE, pad, 0, velocity)
+
+            # Begin capturing the peak velocity
+            if self._strike_window > 0:
+                self.set_pad_state(pad, _PAD_ATTACK, current_ticks)
+                self._strike_peak[pad] = velocity
+                return _ADC_HOLD
+
+            self.set_pad_state(pad, _PAD_HELD, current_ticks)
+            return velocity
+
+        # Capturing the peak velocity
+        if state == _PAD_ATTACK:
+            peak = self._strike_peak[pad]
+
+            # Still rising in the strike window
+            if tapped and velocity >= peak and elapsed < self._strike_window:
+                self._strike_peak[pad] = velocity
+                return _ADC_HOLD
+
+            # The strike window is over or the signal drops, play with the peak velocity
+            self.set_pad_state(pad, _PAD_HELD, current_ticks)
+            return velocity if tapped and velocity > peak else peak
+
+        # Tapped
+        if state == _PAD_HELD:
+            if velocity != _ADC_RELEASED:
+                return velocity
+
+            if elapsed < self._min_held_time:
+                return _ADC_HOLD
+
+            self.set_pad_state(pad, _PAD_RELEASE, current_ticks)
+            elapsed = 0
+
+        # Released, but the signal rises again (chattering)
+        if tapped:
+            self._chatter_suppressed = self._chatter_suppressed + 1
+            self.set_pad_state(pad, _PAD_HELD, current_ticks)
+            return velocity
+
+        # Release is confirmed
+        if velocity == _ADC_RELEASED and elapsed >= self._min_release_time:
+            self.set_pad_state(pad, _PAD_HOLDOFF, current_ticks)
+            self._holdoff_hit[pad] = False
+            return _ADC_RELEASED
+
+        return _ADC_HOLD
+
+    # Strike window in msec to capture the peak velocity of a tapped pad
+    def strike_window(self, window=None):
+        if window is not None:
+            self._strike_window = window if window > 0 else 0
+
+        return self._strike_window
+
     def velocity_curve(self, curve=None):
         if curve is not None:
             if curve < 1.5:
@@ -260,28 +816,551 @@ class ADC_Device_class:
                 
             self._velocity_curve = curve
 
+            # Calibrated gates depend on the velocity curve
+            if self._noise_raw is not None:
+                self.calibrated_gates()
+            else:
+                self.make_velocity_tables()
+
         return self._velocity_curve
 
+    def is_calibrated(self):
+        return self._noise_raw is not None
+
+    # Make a voltage gate from a noise peak raw ADC value
+    def noise_gate(self, noise_raw):
+        noise = self.curved_voltage(noise_raw * 4.55 / 65535)
+        off_voltage = noise * 2.0 if noise * 2.0 > 20.0 else 20.0
+        pass_voltage = off_voltage * 2.0 if off_voltage > 100.0 else off_voltage + 100.0
+
+        # Too noisy (or touched in calibration), use the default gate
+        if pass_voltage > self._default_gate[0] or off_voltage > self._default_gate[1]:
+            return self._default_gate
+
+        # Quiet pads are not made much more sensitive than the default gate
+        min_pass = self._default_gate[0] * PAD_CALIBRATION_GATE_RATIO
+        min_off = self._default_gate[1] * PAD_CALIBRATION_GATE_RATIO
+        return (pass_voltage if pass_voltage > min_pass else min_pass, off_voltage if off_voltage > min_off else min_off)
+
+    # Set the voltage gates of all pads made from the noise
+    def calibrated_gates(self):
+        for pad in range(8):
+            self._voltage_gate[pad] = self.noise_gate(self._noise_raw[pad])
+
+        self.make_velocity_tables()
+
+    # Calibrate the voltage gates with the noise of all pads at rest
+    def calibrate(self, samples=200):
+        noise_raw = [0] * 8
+        for cnt in range(samples):
+            for channel in _4051_SCAN_ORDER:
+                raw = self.get_raw(channel)
+                if raw > noise_raw[channel]:
+                    noise_raw[channel] = raw
+
+            sleep(0.001)
+
+        self._noise_raw = noise_raw
+        self.calibrated_gates()
+
+    # Load the pad calibration file (and the crosstalk coupling matrix learned and the pad settings if saved)
+    def load_calibration(self, file_name):
+        try:
+            with open(file_name, 'r') as f:
+                json_data = json.load(f)
+
+            if 'HOLDOFF' in json_data:
+                self.holdoff_time(json_data['HOLDOFF'])
+
+            if 'MIN_HELD' in json_data:
+                self.min_held_time(json_data['MIN_HELD'])
+
+            if 'MIN_RELEASE' in json_data:
+                self.min_release_time(json_data['MIN_RELEASE'])
+
+            if 'RECORD_SAMPLES' in json_data:
+                self.record_samples(json_data['RECORD_SAMPLES'])
+
+            if 'SETTLE_DELAY' in json_data:
+                self.settle_delay(json_data['SETTLE_DELAY'])
+
+            if 'DISCARD_SAMPLES' in json_data:
+                self.discard_samples(json_data['DISCARD_SAMPLES'])
+
+            if 'INTEGER_MODE' in json_data:
+                self.integer_mode(json_data['INTEGER_MODE'] == True)
+
+            if 'CROSSTALK' in json_data and len(json_data['CROSSTALK']) == 64:
+                for pair in range(64):
+                    self._crosstalk_coupling[pair] = json_data['CROSSTALK'][pair]
+
+                self._crosstalk_ratio = 0
+                self._crosstalk_learned = True
+
+            if len(json_data['NOISE']) != 8:
+                return False
+
+            self._noise_raw = json_data['NOISE']
+            self.calibrated_gates()
+            return True
+
+        except Exception as e:
+#            print(e, file_name)
+            return False
+
+    # Save the pad calibration file with the crosstalk coupling matrix learned and the pad settings
+    # (the file system must be writable by boot.py)
+    def save_calibration(self, file_name):
+        if self._noise_raw is None:
+            return False
+
+        json_data = {'NOISE': self._noise_raw, 'HOLDOFF': self._holdoff_time, 'MIN_HELD': self._min_held_time, 'MIN_RELEASE': self._min_release_time, 'RECORD_SAMPLES': self._record_samples, 'SETTLE_DELAY': self._settle_delay, 'DISCARD_SAMPLES': self._discard_samples, 'INTEGER_MODE': self._integer_mode}
+        if self._crosstalk_learned:
+            json_data['CROSSTALK'] = list(self._crosstalk_coupling)
+
+        try:
+            with open(file_name, 'w') as f:
+                json.dump(json_data, f)
+
+            return True
+
+        except Exception as e:
+#            print(e, file_name)
+            return False
+
+    # Voltage gate (on, off) of a pad
+    def voltage_gate(self, pad, gate=None):
+        if gate is not None:
+            self._voltage_gate[pad] = gate
+            self.make_velocity_tables()
+
+        return self._voltage_gate[pad]
+
+    # Velocity curve applied to a voltage (0.0..5000.0)
+    def curved_voltage(self, voltage_raw):
+        velo_factor = self._velocity_curve
+#        voltage = voltage_raw * (voltage_raw/3.55) * (voltage_raw/3.55) / velo_factor * 1000000.0
+        voltage = voltage_raw * (voltage_raw/velo_factor) * (voltage_raw/velo_factor) * 100000.0
+        if voltage > 5000.0:
+            voltage = 5000.0
+
+        return voltage
+
+    # Pad state of a curved voltage
+    #   _ADC_RELEASED: Pad is released
+    #   _ADC_HOLD    : Between the off and on voltages (keep the current state)
+    #   1..127       : Pad is tapped, the value is the velocity
+    def voltage_state(self, gate, voltage):
+        (pass_voltage, off_voltage) = gate
+
+        # Pad is released
+        if   voltage <= off_voltage:
+            return _ADC_RELEASED
+
+        # Pad is tapped
+        elif voltage >= pass_voltage:
+            velocity = int((voltage - pass_voltage) * 128.0 / (5000.0 - pass_voltage)) + 1
+            return velocity if velocity <= 127 else 127
+
+        return _ADC_HOLD
+
+    # Pad state of a raw ADC value with float arithmetic
+    def pad_state(self, gate, raw):
+        return self.voltage_state(gate, self.curved_voltage(raw * 4.55 / 65535))
+
+    # Make a lookup table from a quantized raw ADC value to a pad state
+    #   The table ends at the level where the curved voltage saturates at 5000.0,
+    #   higher levels must use the last element.
+    def make_velocity_table(self, gate):
+        table = bytearray(self._velocity_table_top + 1)
+        for level in range(self._velocity_table_top + 1):
+            table[level] = self.pad_state(gate, level << _ADC_TABLE_SHIFT)
+
+        return table
+
+    # The lowest raw ADC value whose curved voltage is over (or equal to) a voltage
+    def raw_threshold(self, voltage, equal=True):
+        low = 0
+        high = 65536
+        while low < high:
+            mid = (low + high) >> 1
+            curved = self.curved_voltage(mid * 4.55 / 65535)
+            if curved > voltage or (equal and curved == voltage):
+                high = mid
+            else:
+                low = mid + 1
+
+        return low
+
+    # Make the integer gate of a pad
+    #   (raw to release, raw to tap, raw to saturate, cube to tap, cube per velocity)
+    #   cube is ((raw>>2)^2 >> 6) * (raw>>2), that is raw^3 / 4096 under 2^30 (no long int).
+    def make_integer_gate(self, gate):
+        (pass_voltage, off_voltage) = gate
+        velo_factor = self._velocity_curve
+        cube_voltage = (4.55 / 65535) ** 3 * 100000.0 / (velo_factor * velo_factor) * 4096	# voltage = cube * cube_voltage
+        return (self.raw_threshold(off_voltage, False), self.raw_threshold(pass_voltage), self.raw_threshold(5000.0),
+                int(pass_voltage / cube_voltage + 0.5), int((5000.0 - pass_voltage) / 128.0 / cube_voltage + 0.5))
+
+    # Pad state of a raw ADC value with integer arithmetic
+    def pad_state_integer(self, pad, raw):
+        (raw_release, raw_tap, raw_saturate, cube_tap, cube_step) = self._integer_gate[pad]
+
+        # Pad is released
+        if raw < raw_release:
+            return _ADC_RELEASED
+
+        # Between the off and on voltages
+        if raw < raw_tap:
+            return _ADC_HOLD
+
+        # Pad is tapped
+        if raw >= raw_saturate:
+            return 127
+
+        level = raw >> 2
+        velocity = (((level * level) >> 6) * level - cube_tap) // cube_step + 1
+        if velocity < 1:
+            return 1
+
+        return velocity if velocity <= 127 else 127
+
+    # Integer arithmetic mode (no lookup tables)
+    def integer_mode(self, turn_on=None):
+        if turn_on is not None:
+            self._integer_mode = turn_on
+            self.make_velocity_tables()
+
+        return self._integer_mode
+
+    # Rebuild the lookup tables or the integer gates,
+    # call this whenever the velocity curve or a voltage gate changes
+    def make_velocity_tables(self):
+        # Integer arithmetic mode
+        if self._integer_mode:
+            self._velocity_table = [None] * 8
+            gates = {}
+            for pad in range(8):
+                gate = self._voltage_gate[pad]
+                if gate not in gates:
+                    gates[gate] = self.make_integer_gate(gate)
+
+                self._integer_gate[pad] = gates[gate]
+
+            return
+
+        # The lowest level where the curved voltage saturates (v^3 / curve^2 * 100000 = 5000)
+        level = int((0.05 * self._velocity_curve * self._velocity_curve) ** (1.0 / 3.0) * 65535 / 4.55) >> _ADC_TABLE_SHIFT
+        self._velocity_table_top = level + 1 if level + 1 < _ADC_TABLE_SIZE else _ADC_TABLE_SIZE - 1
+
+        tables = {}
+        for pad in range(8):
+            gate = self._voltage_gate[pad]
+            if gate not in tables:
+                tables[gate] = self.make_velocity_table(gate)
+
+            self._velocity_table[pad] = tables[gate]
+
+    # Uniform crosstalk coupling ratio (%) for all pad pairs (0 is off)
+    def crosstalk_ratio(self, ratio=None):
+        if ratio is not None:
+            self._crosstalk_ratio = ratio if ratio > 0 else 0
+            self._crosstalk_learned = False
+            for pair in range(64):
+                self._crosstalk_coupling[pair] = 0 if pair // 8 == pair % 8 else self._crosstalk_ratio
+
+        return self._crosstalk_ratio
+
+    # Crosstalk coupling ratio (%) from a dominant pad to another pad
+    def crosstalk_coupling(self, dominant, pad, ratio=None):
+        if ratio is not None:
+            self._crosstalk_coupling[dominant * 8 + pad] = ratio if ratio <= 100 else 100
+
+        return self._crosstalk_coupling[dominant * 8 + pad]
+
+    # Learn the coupling matrix while playing (from the matrix learned if any),
+    # the matrix is used after learning until another ratio is selected
+    def crosstalk_learning(self, learn=None):
+        if learn is not None:
+            if learn and not self._crosstalk_learned:
+                self.crosstalk_ratio(0)
+
+            elif not learn and self._crosstalk_learning:
+                self._crosstalk_learned = True
+
+            self._crosstalk_learning = learn
+
+        return self._crosstalk_learning
+
+    # The coupling matrix learned is used or not
+    def crosstalk_learned(self):
+        return self._crosstalk_learned
+
+    def crosstalk_rejected(self):
+        return self._crosstalk_rejected
+
+    def counters_reset(self):
+        self._crosstalk_rejected = 0
+        self._chatter_suppressed = 0
+        self._holdoff_suppressed = 0
+
+    # Print the pad counters to the serial console
+    def dump(self):
+        print('PAD RETRIGGER: suppressed chatter={:d} holdoff={:d} (min held={:d}ms min release={:d}ms holdoff={:d}ms)'.format(self._chatter_suppressed, self._holdoff_suppressed, self._min_held_time, self._min_release_time, self._holdoff_time))
+        print('PAD CROSSTALK: {} rejected={:d}'.format('LEARN' if self._crosstalk_learning else 'LEARNED' if self._crosstalk_learned else 'OFF' if self._crosstalk_ratio == 0 else str(self._crosstalk_ratio) + '%', self._crosstalk_rejected))
+        if self._crosstalk_learning or self._crosstalk_learned:
+            for dominant in range(8):
+                print('PAD {:d} ->'.format(dominant + 1), ' '.join(['{:3d}'.format(self._crosstalk_coupling[dominant * 8 + pad]) for pad in range(8)]))
+
+    # Reject the new triggers caused by crosstalk from the dominant pad,
+    # or learn the coupling ratios while learning.
+    def reject_crosstalk(self, dominant, triggers):
+        raw_values = self._raw_values
+        velocities = self._velocities
+        dominant_raw = raw_values[dominant]
+        if dominant_raw <= 0 or (triggers == 0 and not self._crosstalk_learning):
+            return
+
+        coupling = dominant * 8
+        if self._crosstalk_learning:
+            self.learn_crosstalk(dominant)
+
+        for pad in range(8):
+            if pad == dominant or not self._sampled[pad]:
+                continue
+
+            # A new trigger under the coupling ratio is a ghost
+            velocity = velocities[pad]
+            if velocity != _ADC_RELEASED and velocity != _ADC_HOLD and self._pad_state[pad] == _PAD_IDLE:
+                if raw_values[pad] * 100 < self._crosstalk_coupling[coupling + pad] * dominant_raw:
+                    velocities[pad] = _ADC_HOLD
+                    self._crosstalk_rejected = self._crosstalk_rejected + 1
+
+    # Learn the coupling ratios from the dominant pad to the pads not played (noise is subtracted).
+    # The peak ratio in a strike is kept (the peaks make the ghost triggers), the ratios decay slowly
+    # on each new strike of the dominant pad to forget an occasional high peak.
+    def learn_crosstalk(self, dominant):
+        raw_values = self._raw_values
+        dominant_raw = raw_values[dominant]
+        coupling = dominant * 8
+        strike = self._pad_state[dominant] == _PAD_IDLE
+        for pad in range(8):
+            if pad == dominant or not self._sampled[pad] or self._pad_state[pad] != _PAD_IDLE:
+                continue
+
+            learned = self._crosstalk_coupling[coupling + pad]
+            if strike:
+                learned = learned - (learned >> _CROSSTALK_DECAY_SHIFT)
+
+            noise = 0 if self._noise_raw is None else self._noise_raw[pad]
+            ratio = (raw_values[pad] - noise) * 100 // dominant_raw
+            if ratio < _CROSSTALK_LEARN_MAX:
+                ratio = ratio + _CROSSTALK_MARGIN if ratio > 0 else _CROSSTALK_MARGIN
+                if ratio > learned:
+                    learned = ratio
+
+            self._crosstalk_coupling[coupling + pad] = learned
+
+    # Wait time in seconds for the signal to settle after changing the 4051 channel
+    def settle_delay(self, delay=None):
+        if delay is not None:
+            self._settle_delay = delay if delay > 0.0 else 0.0
+
+        return self._settle_delay
+
+    # Number of samples to discard after changing the 4051 channel
+    def discard_samples(self, count=None):
+        if count is not None:
+            self._discard_samples = count if count > 0 else 0
+
+        return self._discard_samples
+
+    # Select an analog channel on 4051, write the selector pins changed only
+    def select_channel(self, analog_channel):
+        changed = analog_channel ^ self._4051_channel
+        if changed == 0:
+            return False
+
+        if changed & 0x1:
+            self._4051_selectors[0].value =  analog_channel & 0x1
+        if changed & 0x2:
+            self._4051_selectors[1].value = (analog_channel & 0x2) >> 1
+        if changed & 0x4:
+            self._4051_selectors[2].value = (analog_channel & 0x4) >> 2
+
+        self._4051_channel = analog_channel
+        return True
+
+    # Select an analog channel on 4051 and read the raw ADC value (0..65535)
+    def get_raw(self, analog_channel):
+        # Let the signal settle on the new channel
+        if self.select_channel(analog_channel):
+            if self._settle_delay > 0.0:
+                sleep(self._settle_delay)
+
+            for discard in range(self._discard_samples):
+                self._adc.value
+
+        return self._adc.value
+
+    # Interval in msec to sample idle pads
+    def idle_scan_interval(self, interval=None):
+        if interval is not None:
+            self._idle_scan_interval = interval if interval > 0 else 0
+
+        return self._idle_scan_interval
+
+    # Read pads in Gray code order into the raw values,
+    # idle pads are skipped unless idle_pads is True.
+    def scan(self, idle_pads=True, current_ticks=0):
+        recording = self._record_buffer is not None
+        first = True
+        for channel in _4051_SCAN_ORDER:
+            if idle_pads or self._pad_active[channel]:
+                self._raw_values[channel] = self.get_raw(channel)
+                self._sampled[channel] = True
+
+                # Record the raw ADC value
+                if recording and self.record_wanted(channel, self._raw_values[channel]):
+                    self.record_sample(channel, self._raw_values[channel], current_ticks if first else -1)
+                    first = False
+            else:
+                self._sampled[channel] = False
+
+        return self._raw_values
+
+    # Number of samples recorded at most (RECORD_SAMPLES in the pad calibration file)
+    def record_samples(self, samples=None):
+        if samples is not None:
+            self._record_samples = samples if samples > 0 else 1
+
+        return self._record_samples
+
+    # Start recording raw ADC samples (4 bytes per sample)
+    def record_start(self, samples=None):
+        self._record_buffer = bytearray((self._record_samples if samples is None else samples) * 4)
+        self._record_count = 0
+        self._record_ticks = supervisor.ticks_ms()
+        for pad in range(8):
+            self._record_last[pad] = -1
+
+    # The pads played, their neighbors and the pads changed are recorded, the pads at rest are not
+    # (the replay keeps the value recorded last), so the samples last while nothing is played
+    def record_wanted(self, channel, raw):
+        pad_active = self._pad_active
+        if not (pad_active[channel] or (channel > 0 and pad_active[channel - 1]) or (channel < 7 and pad_active[channel + 1])):
+            change = raw - self._record_last[channel]
+            if self._record_last[channel] >= 0 and change < _RECORD_CHANGE and change > -_RECORD_CHANGE:
+                return False
+
+        self._record_last[channel] = raw
+        return True
+
+    # Recorder status: 'OFF', 'REC' or 'FULL'
+    def record_status(self):
+        if self._record_buffer is None:
+            return 'OFF'
+
+        return 'REC' if self._record_count * 4 < len(self._record_buffer) else 'FULL'
+
+    # Record a raw ADC sample
+    #   Record: raw (uint16 LE), channel (uint8, bit7 is set at the first sample in a scan),
+    #           msec from the previous scan (uint8, 0..255, at the first sample in a scan)
+    #   cycle_ticks is the ticks of the scan at the first sample in the scan, otherwise -1.
+    def record_sample(self, channel, raw, cycle_ticks):
+        pos = self._record_count * 4
+        buf = self._record_buffer
+        if pos + 4 > len(buf):
+            return
+
+        buf[pos] = raw & 0xff
+        buf[pos + 1] = raw >> 8
+        if cycle_ticks >= 0:
+            delta = ticks_diff(cycle_ticks, self._record_ticks)
+            self._record_ticks = cycle_ticks
+            buf[pos + 2] = channel | 0x80
+            buf[pos + 3] = delta if delta <= 255 else 255
+        else:
+            buf[pos + 2] = channel
+            buf[pos + 3] = 0
+
+        self._record_count = self._record_count + 1
+
+    # Stop recording and save the samples in a file
+    #   File: b'PGA1', number of samples (uint32 LE), records
+    def record_stop(self, file_name):
+        if self._record_buffer is None:
+            return False
+
+        buf = self._record_buffer
+        count = self._record_count
+        self._record_buffer = None
+        try:
+            with open(file_name, 'wb') as f:
+                f.write(b'PGA1')
+                f.write(bytes([count & 0xff, (count >> 8) & 0xff, (count >> 16) & 0xff, count >> 24]))
+                f.write(memoryview(buf)[0:count * 4])
+
+            return True
+
+        except Exception as e:
+#            print(e, file_name)
+            return False
+
     def get_voltage(self, analog_channel):
-        self._4051_selectors[0].value =  analog_channel & 0x1
-        self._4051_selectors[1].value = (analog_channel & 0x2) >> 1
-        self._4051_selectors[2].value = (analog_channel & 0x4) >> 2
 #        voltage = self._adc.value * 5.0 / 65535
-        voltage = self._adc.value * 4.55 / 65535
+        voltage = self.get_raw(analog_channel) * 4.55 / 65535
         return voltage
 
     def adc_handler(self):
-        # Get voltages guitar strings
-        velo_factor = self.velocity_curve()
-        for string in list(range(8)):
-            voltage_raw = self.get_voltage(string)
-#            voltage = voltage_raw * (voltage_raw/3.55) * (voltage_raw/3.55) / velo_factor * 1000000.0
-            voltage = voltage_raw * (voltage_raw/velo_factor) * (voltage_raw/velo_factor) * 100000.0
-            if voltage > 5000.0:
-                voltage = 5000.0
+        # Get pad states of guitar strings from the raw ADC values
+        integer_mode = self._integer_mode
+        table_top = self._velocity_table_top
+
+        # Sample idle pads too if the idle scan interval has passed
+        current_ticks = supervisor.ticks_ms()
+        idle_pads = ticks_diff(current_ticks, self._idle_scan_ticks) >= self._idle_scan_interval
+        if idle_pads:
+            self._idle_scan_ticks = current_ticks
+
+        raw_values = self.scan(idle_pads, current_ticks)
+        velocities = self._velocities
+        dominant = -1
+        triggers = 0
+        for string in range(8):
+            if not self._sampled[string]:
+                continue
+
+            if integer_mode:
+                velocity = self.pad_state_integer(string, raw_values[string])
+            else:
+                level = raw_values[string] >> _ADC_TABLE_SHIFT
+                velocity = self._velocity_table[string][level if level < table_top else table_top]
+
+            velocities[string] = velocity
+
+            # The dominant pad in the tapped pads, and count the new triggers
+            if velocity != _ADC_RELEASED and velocity != _ADC_HOLD:
+                if dominant < 0 or raw_values[string] > raw_values[dominant]:
+                    dominant = string
+
+                if self._pad_state[string] == _PAD_IDLE:
+                    triggers = triggers + 1
+
+        # Crosstalk rejection
+        if dominant >= 0 and (self._crosstalk_ratio > 0 or self._crosstalk_learning or self._crosstalk_learned):
+            self.reject_crosstalk(dominant, triggers)
+
+        for string in range(8):
+            if not self._sampled[string]:
+                continue
+
+            # Pad state machine
+            velocity = self.pad_event(string, velocities[string], current_ticks)
+            self._pad_active[string] = velocities[string] != _ADC_RELEASED or self._pad_state[string] != _PAD_IDLE
 
             # Pad is released
-            if   voltage <= self._voltage_gate[string][1]:
+            if   velocity == _ADC_RELEASED:
                 # Turn off after touch effect
                 if self._on_counter[string] < 0:
                     if instrument_guitar.drum_mode() == False or instrument_guitar.drum_mode() and string >= 6:
@@ -297,12 +1376,14 @@ class ADC_Device_class:
                     if self._note_on[string]:
                         self._note_on[string] = False
                         self._adc_on[string] = False
+                        instrument_guitar.release_pad(string)
                 
                 # Note a chord off
                 elif string == 7:
                     if self._play_chord:
                         self._play_chord = False
                         self._adc_on[string] = False
+                        instrument_guitar.release_pad(string)
 
                 # Finish pitch bend
                 elif string == 6:
@@ -312,16 +1393,8 @@ class ADC_Device_class:
                         self._adc_on[string] = False                    
 #                        print('PITCH BEND off')
                         
-            # Pad is tapped
-            elif voltage >= self._voltage_gate[string][0]:
-                pass_voltage = self._voltage_gate[string][0]
-
-                # velocity
-#                velocity = int((voltage - pass_voltage) * 128.0 * 3.0 / (5000.0 - pass_voltage)) + 30
-                velocity = int((voltage - pass_voltage) * 128.0 / (5000.0 - pass_voltage)) + 1
-                if velocity > 127:
-                    velocity = 127
-
+            # Pad is tapped (velocity is 1..127)
+            elif velocity != _ADC_HOLD:
                 # First touch
                 if self._adc_on[string] == False:
 #                    self._on_counter[string] = 0
@@ -375,7 +1448,7 @@ class ADC_Device_class:
                             self._adc_on[string] = False                    
 #                            print('PITCH BEND OFF')
 
-                        bend_velocity = 9000 + int((7000 / 127) * velocity)
+                        bend_velocity = 9000 + (7000 * velocity) // 127
 #                        print('PITCH BEND ON:', bend_velocity, voltage, velocity)
                         synth.set_pitch_bend(bend_velocity)
                         self._note_on[string] = True
@@ -455,6 +1528,32 @@ class Input_Devices_class:
 ### Unit-MIDI Instrument class
 ################################
 send_note_on = []
+
+# MIDI status bytes (channel 0)
+_MIDI_NOTE_OFF = const(0x80)
+_MIDI_NOTE_ON = const(0x90)
+_MIDI_CONTROL_CHANGE = const(0xB0)
+_MIDI_PROGRAM_CHANGE = const(0xC0)
+_MIDI_PITCH_BEND = const(0xE0)
+
+# MIDI output queues in priority order
+_MIDI_DRUM_CHANNEL = const(9)		# GM drum channel (MIDI channel 10)
+_MIDI_QUEUE_NOTE = const(0)			# Note on/off
+_MIDI_QUEUE_BEND = const(1)			# Pitch bend
+_MIDI_QUEUE_CONTROL = const(2)		# Control change, program change, ...
+MIDI_QUEUE_SIZES = (32, 8, 16)		# Messages in each queue
+
+# Control changes not sent again with the same value (the others are always sent): modulation wheel MSB and LSB
+CC_CACHED_CONTROLS = (1, 33)
+
+# Voice allocator
+VOICE_MAX = 24						# Voices (the maximum polyphony)
+VOICE_POLYPHONY = (4, 5, 6, 7, 8, 12, 16, 24)	# Polyphony selectable
+_VOICE_NONE = const(255)			# No note / string / pad
+_VOICE_STEAL_OLDEST = const(0)		# Steal the oldest voice if the polyphony is full
+_VOICE_STEAL_QUIETEST = const(1)	# Steal the quietest voice (the oldest in the quietest ones)
+VOICE_STEAL_NAMES = ('OLDEST', 'QUIETEST')
+
 class USB_MIDI_Instrument_class:
     # Constructor
     def __init__(self):
@@ -481,11 +1580,105 @@ class USB_MIDI_Instrument_class:
         # USB MIDI device
 #        print('USB MIDI:', usb_midi.ports)
         self._midi_channel = 0
-        self._send_note_on = [[]] * 16
-        self._usb_midi = [None] * 16
-        for channel in list(range(16)):
-#            self._usb_midi[channel] = adafruit_midi.MIDI(midi_in=usb_midi.ports[0], midi_out=usb_midi.ports[1], out_channel=channel)
-            self._usb_midi[channel] = adafruit_midi.MIDI(midi_out=usb_midi.ports[1], out_channel=channel)
+        self._notes_on = bytearray(16 * 16)		# Notes sounding, 128 bits for each channel [channel * 16 + note // 8]
+        self._pitch_class_notes = bytearray(12)	# Number of notes sounding in each pitch class (C..B) except the drum channel
+        self._pitch_classes = 0					# Pitch classes sounding (bit 0 is C .. bit 11 is B)
+
+        # Single MIDI writer for all channels (no adafruit_midi.MIDI object per channel).
+        # Messages are put in the ring queues (3 bytes and a sequence number per message) and returned immediately,
+        # the MIDI output task writes the queues in priority order at once, or in the order queued
+        # if a note message follows a pitch bend or a control change of its channel in the queues.
+        self._midi_out = usb_midi.ports[1]
+        self._midi_queues = (bytearray(MIDI_QUEUE_SIZES[0] * 4), bytearray(MIDI_QUEUE_SIZES[1] * 4), bytearray(MIDI_QUEUE_SIZES[2] * 4))
+        self._midi_queue_head = [0, 0, 0]
+        self._midi_queue_count = [0, 0, 0]
+        self._midi_sequence = 0							# Sequence number of the next message (0..255)
+        self._midi_in_order = False						# Write the queues in the order queued
+        self._midi_buffer = bytearray(sum(MIDI_QUEUE_SIZES) * 3)
+
+        # Last controller values sent not to send redundant messages (0xff / -1 is unknown)
+        self._cc_values = bytearray(16 * len(CC_CACHED_CONTROLS))	# Control change [channel * controls + CC_CACHED_CONTROLS index]
+        self._rpn_pitch_bend_range = bytearray(16)		# RPN 0 (pitch bend range) data entry
+        self._continuous_values = [-1] * 32				# Continuous controllers [pitch bend 0..15, modulation wheel 16..31]
+
+        # Minimum interval of the continuous controllers, the latest value in the interval is held and sent later
+        self._controller_interval = 0					# msec (0 is no limit)
+        self._continuous_ticks = [0] * 32				# Ticks when the value was sent
+        self._continuous_pending = [-1] * 32			# Value held (-1 is nothing)
+        self._continuous_held = 0						# Number of values held
+
+        # Controller messages sent, skipped as redundant, and thinned out by the minimum interval
+        self._controller_sent = 0
+        self._controller_redundant = 0
+        self._controller_thinned = 0
+        self.controller_cache_clear()
+
+        # Voices sounding: note key (_VOICE_NONE is free), channel, velocity, string and pad played, ticks when played
+        self._voice_keys = bytearray([_VOICE_NONE] * VOICE_MAX)
+        self._voice_channels = bytearray(VOICE_MAX)
+        self._voice_velocities = bytearray(VOICE_MAX)
+        self._voice_strings = bytearray(VOICE_MAX)
+        self._voice_pads = bytearray(VOICE_MAX)
+        self._voice_ticks = [0] * VOICE_MAX
+        self._voice_count = 0
+        self._polyphony = VOICE_MAX
+        self._voice_steal = _VOICE_STEAL_OLDEST
+        self._voices_stolen = 0
+
+    # Change the MIDI output port (an object which implements write(buffer, length))
+    def midi_out(self, port):
+        self.midi_flush()
+        self._midi_out = port
+
+    # Number of messages in the queues
+    def midi_queued(self):
+        return self._midi_queue_count[0] + self._midi_queue_count[1] + self._midi_queue_count[2]
+
+    # Write all messages in the queues with a single write (called from the MIDI output task):
+    # in priority order (notes, pitch bend, then control), or in the order queued to keep the order in a channel
+    def midi_flush(self):
+        buf = self._midi_buffer
+        size = 0
+        counts = self._midi_queue_count
+        heads = self._midi_queue_head
+        while counts[0] + counts[1] + counts[2] > 0:
+            # Queue to write from
+            if self._midi_in_order:
+                queue_num = -1
+                for num in (_MIDI_QUEUE_NOTE, _MIDI_QUEUE_BEND, _MIDI_QUEUE_CONTROL):
+                    if counts[num] > 0:
+                        sequence = self._midi_queues[num][heads[num] * 4 + 3]
+                        if queue_num < 0 or (sequence - oldest) & 0xff >= 128:
+                            queue_num = num
+                            oldest = sequence
+
+            elif counts[_MIDI_QUEUE_NOTE] > 0:
+                queue_num = _MIDI_QUEUE_NOTE
+            elif counts[_MIDI_QUEUE_BEND] > 0:
+                queue_num = _MIDI_QUEUE_BEND
+            else:
+                queue_num = _MIDI_QUEUE_CONTROL
+
+            queue = self._midi_queues[queue_num]
+            head = heads[queue_num]
+            pos = head * 4
+            status = queue[pos]
+            buf[size]     = status
+            buf[size + 1] = queue[pos + 1]
+
+            # Program change and channel pressure have 1 data byte
+            if status & 0xe0 == _MIDI_PROGRAM_CHANGE:
+                size = size + 2
+            else:
+                buf[size + 2] = queue[pos + 2]
+                size = size + 3
+
+            heads[queue_num] = head + 1 if head + 1 < MIDI_QUEUE_SIZES[queue_num] else 0
+            counts[queue_num] = counts[queue_num] - 1
+
+        self._midi_in_order = False
+        if size > 0:
+            self._midi_out.write(buf, size)
 
     def midi_channel(self, channel=None):
         if channel is not None:
@@ -531,57 +1724,459 @@ class USB_MIDI_Instrument_class:
             channel = self.midi_channel()
 
 #        print('MIDI SEND:', channel, midi_msg)
-#        print('INSTANCE:', isinstance(midi_msg, NoteOn), isinstance(midi_msg, NoteOff), self._send_note_on[channel])
+#        print('INSTANCE:', isinstance(midi_msg, NoteOn), isinstance(midi_msg, NoteOff), self.note_is_on(midi_msg.note, channel))
         if isinstance(midi_msg, NoteOn):
-            if midi_msg.note in self._send_note_on[channel]:
-                self._usb_midi[channel].send(NoteOff(midi_msg.note, channel=channel))
-                sleep(0.005)
-#                print('MIDI NOTE OFF:', midi_msg.note)
-#                print('NOTE ON CH-a:', channel, self._send_note_on[channel])
+            self.note_send(_MIDI_NOTE_ON, midi_msg.note, midi_msg.velocity, channel)
+            return
 
-            else:
-                self._send_note_on[channel].append(midi_msg.note)
+        elif isinstance(midi_msg, NoteOff):
+            self.note_send(_MIDI_NOTE_OFF, midi_msg.note, midi_msg.velocity, channel)
+            return
 
-            pico_led.value = True
+        # Send a MIDI message object
+        midi_msg.channel = channel
+        self.midi_flush()
+        data = midi_msg.__bytes__()
+        self._midi_out.write(data, len(data))
 
-        elif isinstance(midi_msg, NoteOff):
-#            print('GET NOTE OFF:' + str(midi_msg.note))
-            if midi_msg.note in self._send_note_on[channel]:
-                self._send_note_on[channel].remove(midi_msg.note)
-#                print('NOTE ON CH-b:', channel, self._send_note_on[channel])
+    # Put a MIDI message in the queue for its priority (no allocation),
+    # the queues are written at once if the queue is full.
+    def midi_write(self, status, data1, data2, channel):
+        if status <= _MIDI_NOTE_ON:
+            queue_num = _MIDI_QUEUE_NOTE
 
-            pico_led.value = False
+            # A note must not be written before a pitch bend or a control change of its channel queued already
+            if not self._midi_in_order and (self.midi_queued_in_channel(_MIDI_QUEUE_BEND, channel) or self.midi_queued_in_channel(_MIDI_QUEUE_CONTROL, channel)):
+                self._midi_in_order = True
+
+        elif status == _MIDI_PITCH_BEND:
+            queue_num = _MIDI_QUEUE_BEND
+        else:
+            queue_num = _MIDI_QUEUE_CONTROL
+
+        count = self._midi_queue_count[queue_num]
+        slots = MIDI_QUEUE_SIZES[queue_num]
+        if count == slots:
+            self.midi_flush()
+            count = 0
+
+        pos = self._midi_queue_head[queue_num] + count
+        pos = (pos if pos < slots else pos - slots) * 4
+        queue = self._midi_queues[queue_num]
+        queue[pos]     = status | channel
+        queue[pos + 1] = data1
+        queue[pos + 2] = data2
+        queue[pos + 3] = self._midi_sequence
+        self._midi_sequence = (self._midi_sequence + 1) & 0xff
+        self._midi_queue_count[queue_num] = count + 1
+
+    # A message of a channel is in a queue or not
+    def midi_queued_in_channel(self, queue_num, channel):
+        count = self._midi_queue_count[queue_num]
+        if count == 0:
+            return False
+
+        queue = self._midi_queues[queue_num]
+        slots = MIDI_QUEUE_SIZES[queue_num]
+        pos = self._midi_queue_head[queue_num]
+        while count > 0:
+            if queue[pos * 4] & 0x0f == channel:
+                return True
+
+            pos = pos + 1 if pos + 1 < slots else 0
+            count = count - 1
+
+        return False
+
+    # Fast MIDI output without adafruit_midi message objects (no allocation, no range check)
+    def write_note_on(self, note_key, velocity, channel):
+        self.midi_write(_MIDI_NOTE_ON, note_key, velocity, channel)
+
+    def write_note_off(self, note_key, channel):
+        self.midi_write(_MIDI_NOTE_OFF, note_key, 0, channel)
+
+    def write_control_change(self, control, value, channel):
+        self.midi_write(_MIDI_CONTROL_CHANGE, control, value, channel)
+
+    # Pitch bend value is 0..16383 (8192 is center)
+    def write_pitch_bend(self, value, channel):
+        self.midi_write(_MIDI_PITCH_BEND, value & 0x7f, (value >> 7) & 0x7f, channel)
+
+    def write_program_change(self, program, channel):
+        self.midi_write(_MIDI_PROGRAM_CHANGE, program, 0, channel)
+
+    # Forget the controller values sent (the next messages are sent anyway)
+    def controller_cache_clear(self):
+        for index in range(len(self._cc_values)):
+            self._cc_values[index] = 0xff
+
+        for index in range(16):
+            self._rpn_pitch_bend_range[index] = 0xff
+
+        for index in range(32):
+            self._continuous_values[index] = -1
+            self._continuous_pending[index] = -1
+
+        self._continuous_held = 0
+
+    # Minimum interval in msec of the continuous controllers (pitch bend, modulation wheel)
+    def controller_interval(self, msec=None):
+        if msec is not None:
+            self._controller_interval = msec if msec > 0 else 0
+
+        return self._controller_interval
+
+    # Numbers of the controller messages (sent, redundant, thinned out)
+    def controller_stats(self):
+        return (self._controller_sent, self._controller_redundant, self._controller_thinned)
+
+    def controller_stats_reset(self):
+        self._controller_sent = 0
+        self._controller_redundant = 0
+        self._controller_thinned = 0
+        self._voices_stolen = 0
+
+    # Print the controller and the voice statistics to the USB serial console
+    def midi_dump(self):
+        sent, redundant, thinned = self.controller_stats()
+        total = sent + redundant + thinned
+        print('MIDI CONTROLLERS interval={:d}ms sent={:d} redundant={:d} thinned={:d} saved={:d}%'.format(self._controller_interval, sent, redundant, thinned, (redundant + thinned) * 100 // total if total > 0 else 0))
+        print('MIDI VOICES polyphony={:d} steal={} sounding={:d} stolen={:d}'.format(self._polyphony, VOICE_STEAL_NAMES[self._voice_steal], self._voice_count, self._voices_stolen))
+
+    # Send a control change unless the controller in CC_CACHED_CONTROLS has the value already
+    def control_change(self, control, value, channel):
+        for cached in range(len(CC_CACHED_CONTROLS)):
+            if CC_CACHED_CONTROLS[cached] == control:
+                index = channel * len(CC_CACHED_CONTROLS) + cached
+                if self._cc_values[index] == value:
+                    self._controller_redundant = self._controller_redundant + 1
+                    return
+
+                self._cc_values[index] = value
+                break
+
+        self._controller_sent = self._controller_sent + 1
+        self.write_control_change(control, value, channel)
+
+    # Send a continuous controller value (slot: channel for pitch bend, channel + 16 for modulation wheel)
+    # unless it has the value already, the value is held until the minimum interval passes.
+    def continuous_send(self, slot, value):
+        # The value held is not sent any more
+        if self._continuous_pending[slot] >= 0:
+            self._continuous_pending[slot] = -1
+            self._continuous_held = self._continuous_held - 1
+            self._controller_thinned = self._controller_thinned + 1
+
+        if self._continuous_values[slot] == value:
+            self._controller_redundant = self._controller_redundant + 1
+            return
 
-        # Send a MIDI message
-        self._usb_midi[channel].send(midi_msg)
+        # The rest value (pitch bend center, modulation 0) is sent immediately
+        current_ticks = supervisor.ticks_ms()
+        rest = 8192 if slot < 16 else 0
+        if self._controller_interval > 0 and value != rest and self._continuous_values[slot] >= 0 and ticks_diff(current_ticks, self._continuous_ticks[slot]) < self._controller_interval:
+            self._continuous_pending[slot] = value
+            self._continuous_held = self._continuous_held + 1
+            return
+
+        self.continuous_write(slot, value, current_ticks)
+
+    def continuous_write(self, slot, value, ticks):
+        self._continuous_values[slot] = value
+        self._continuous_ticks[slot] = ticks
+        if slot < 16:
+            self._controller_sent = self._controller_sent + 1
+            self.write_pitch_bend(value, slot)
+
+        # Modulation wheel MSB and LSB (control_change() skips the value sent already)
+        else:
+            self.control_change(1, value >> 7, slot - 16)
+            self.control_change(33, value & 0x7f, slot - 16)
+
+    # Send the continuous controller values held in a channel before a note on not to play the note with the old values
+    def continuous_note_on(self, channel):
+        current_ticks = supervisor.ticks_ms()
+        for slot in (channel, channel + 16):
+            value = self._continuous_pending[slot]
+            if value >= 0:
+                self._continuous_pending[slot] = -1
+                self._continuous_held = self._continuous_held - 1
+                self.continuous_write(slot, value, current_ticks)
+
+    # Send the continuous controller values held if the minimum interval has passed (called from the MIDI output task)
+    def continuous_flush(self):
+        if self._continuous_held == 0:
+            return
+
+        current_ticks = supervisor.ticks_ms()
+        for slot in range(32):
+            value = self._continuous_pending[slot]
+            if value >= 0 and ticks_diff(current_ticks, self._continuous_ticks[slot]) >= self._controller_interval:
+                self._continuous_pending[slot] = -1
+                self._continuous_held = self._continuous_held - 1
+                self.continuous_write(slot, value, current_ticks)
+
+    # Maximum number of voices sounding
+    def polyphony(self, voices=None):
+        if voices is not None:
+            self._polyphony = voices if 0 < voices <= VOICE_MAX else VOICE_MAX
+
+        return self._polyphony
+
+    # Voice to steal if the polyphony is full (_VOICE_STEAL_OLDEST, _VOICE_STEAL_QUIETEST)
+    def voice_steal(self, policy=None):
+        if policy is not None:
+            self._voice_steal = policy % len(VOICE_STEAL_NAMES)
+
+        return self._voice_steal
+
+    # Number of voices sounding
+    def voice_count(self):
+        return self._voice_count
+
+    # Allocate a voice to a note on (no allocation),
+    # the note sounding on the same string is turned off, and a voice is stolen if the polyphony is full
+    def voice_on(self, note_key, velocity, channel, string, pad, ticks):
+        slot = -1
+        free = -1
+        for voice in range(VOICE_MAX):
+            key = self._voice_keys[voice]
+            if key == _VOICE_NONE:
+                if free < 0:
+                    free = voice
+
+            elif self._voice_channels[voice] == channel:
+                if key == note_key:
+                    slot = voice
+
+                # A string plays one note at a time
+                elif string != _VOICE_NONE and self._voice_strings[voice] == string:
+                    self.voice_stop(voice)
+                    if free < 0:
+                        free = voice
+
+        if slot < 0:
+            # Steal voices until the polyphony has room (it may have been lowered)
+            while free < 0 or self._voice_count >= self._polyphony:
+                free = self.voice_victim()
+                self.voice_stop(free)
+                self._voices_stolen = self._voices_stolen + 1
+
+            slot = free
+            self._voice_count = self._voice_count + 1
+
+        self._voice_keys[slot] = note_key
+        self._voice_channels[slot] = channel
+        self._voice_velocities[slot] = velocity
+        self._voice_strings[slot] = string
+        self._voice_pads[slot] = pad
+        self._voice_ticks[slot] = ticks
+
+    # Voice to steal by the policy
+    def voice_victim(self):
+        victim = -1
+        for voice in range(VOICE_MAX):
+            if self._voice_keys[voice] != _VOICE_NONE:
+                if victim < 0:
+                    victim = voice
+
+                elif self._voice_steal == _VOICE_STEAL_QUIETEST and self._voice_velocities[voice] != self._voice_velocities[victim]:
+                    if self._voice_velocities[voice] < self._voice_velocities[victim]:
+                        victim = voice
+
+                elif ticks_diff(self._voice_ticks[voice], self._voice_ticks[victim]) < 0:
+                    victim = voice
+
+        return victim
+
+    # Turn a voice off with note off
+    def voice_stop(self, voice):
+        note_key = self._voice_keys[voice]
+        channel = self._voice_channels[voice]
+        self.midi_write(_MIDI_NOTE_OFF, note_key, 0, channel)
+        self.note_set_on(note_key, channel, False)
+        self._voice_keys[voice] = _VOICE_NONE
+        self._voice_count = self._voice_count - 1
+
+    # Free the voice of a note turned off
+    def voice_off(self, note_key, channel):
+        for voice in range(VOICE_MAX):
+            if self._voice_keys[voice] == note_key and self._voice_channels[voice] == channel:
+                self._voice_keys[voice] = _VOICE_NONE
+                self._voice_count = self._voice_count - 1
+                return
+
+    # Turn off the voices played by a pad (mute on releasing the pad)
+    def voices_release(self, pad):
+        for voice in range(VOICE_MAX):
+            if self._voice_keys[voice] != _VOICE_NONE and self._voice_pads[voice] == pad:
+                self.voice_stop(voice)
+
+    # Active note tracker: a note sounding or not in a channel
+    def note_is_on(self, note_key, channel):
+        return self._notes_on[(channel << 4) | (note_key >> 3)] & (1 << (note_key & 7)) != 0
+
+    def note_set_on(self, note_key, channel, sounding):
+        index = (channel << 4) | (note_key >> 3)
+        bit = 1 << (note_key & 7)
+        if sounding:
+            if self._notes_on[index] & bit == 0:
+                self._notes_on[index] = self._notes_on[index] | bit
+                if channel == _MIDI_DRUM_CHANNEL:
+                    return
+
+                pitch_class = note_key % 12
+                self._pitch_class_notes[pitch_class] = self._pitch_class_notes[pitch_class] + 1
+                self._pitch_classes = self._pitch_classes | (1 << pitch_class)
+
+        elif self._notes_on[index] & bit:
+            self._notes_on[index] = self._notes_on[index] & ~bit
+            if channel == _MIDI_DRUM_CHANNEL:
+                return
+
+            pitch_class = note_key % 12
+            self._pitch_class_notes[pitch_class] = self._pitch_class_notes[pitch_class] - 1
+            if self._pitch_class_notes[pitch_class] == 0:
+                self._pitch_classes = self._pitch_classes & ~(1 << pitch_class)
+
+    # Pitch classes of the notes sounding in all channels except the drum channel (12 bits mask, bit 0 is C)
+    def pitch_classes(self):
+        return self._pitch_classes
+
+    # Count the notes sounding in each pitch class again (after clearing notes)
+    def pitch_classes_count(self):
+        self._pitch_classes = 0
+        for pitch_class in range(12):
+            self._pitch_class_notes[pitch_class] = 0
+
+        for channel in range(16):
+            note_key = self.next_note_on(channel, 0) if channel != _MIDI_DRUM_CHANNEL else -1
+            while note_key >= 0:
+                pitch_class = note_key % 12
+                self._pitch_class_notes[pitch_class] = self._pitch_class_notes[pitch_class] + 1
+                self._pitch_classes = self._pitch_classes | (1 << pitch_class)
+                note_key = self.next_note_on(channel, note_key + 1)
+
+    # The lowest note sounding from note_key in a channel (-1 is none), no allocation to iterate like:
+    #   note = synth.next_note_on(channel, 0)
+    #   while note >= 0:
+    #       note = synth.next_note_on(channel, note + 1)
+    def next_note_on(self, channel, note_key):
+        if note_key > 127:
+            return -1
+
+        notes_on = self._notes_on
+        index = (channel << 4) | (note_key >> 3)
+        last = (channel << 4) | 15
+        bits = notes_on[index] >> (note_key & 7)
+        while bits == 0:
+            if index >= last:
+                return -1
+
+            index = index + 1
+            bits = notes_on[index]
+            note_key = (index & 15) << 3
+
+        while bits & 1 == 0:
+            bits = bits >> 1
+            note_key = note_key + 1
+
+        return note_key
+
+    # Send note on (_MIDI_NOTE_ON) or note off (_MIDI_NOTE_OFF) without allocation
+    def note_send(self, status, note_key, velocity, channel, string=_VOICE_NONE, pad=_VOICE_NONE):
+        self.key_send(status, note_key, velocity, channel, string, pad, supervisor.ticks_ms())
 
         # DEBUG
         if application._DEBUG_MODE:
-            if isinstance(midi_msg, NoteOn):
-                if midi_msg.velocity == 0:
-                    application.show_message('off:' + str(midi_msg.note) + '/' + str(midi_msg.velocity), 0, 55, 1)
+            if status == _MIDI_NOTE_ON:
+                if velocity == 0:
+                    application.show_message('off:' + str(note_key) + '/' + str(velocity), 0, 55, 1)
                 else:
-                    application.show_message('ON :' + str(midi_msg.note) + '/' + str(midi_msg.velocity), 0, 55, 1)
-            elif isinstance(midi_msg, NoteOff):
-                application.show_message('OFF:' + str(midi_msg.note), 0, 55, 1)
+                    application.show_message('ON :' + str(note_key) + '/' + str(velocity), 0, 55, 1)
+            else:
+                application.show_message('OFF:' + str(note_key), 0, 55, 1)
+
+    # Send note on (_MIDI_NOTE_ON) or note off (_MIDI_NOTE_OFF) of the notes (-1 is no note) plus offset,
+    # they are written at once by the MIDI output task, a note on already is turned off just before the note on
+    # (the notes are for the strings 1..6 and the on-chord note, played by a pad)
+    def notes_send(self, status, notes, offset, velocity, channel, pad=_VOICE_NONE):
+        current_ticks = supervisor.ticks_ms()
+        for string in range(len(notes)):
+            note = notes[string]
+            if note >= 0:
+                self.key_send(status, note + offset, velocity, channel, string, pad, current_ticks)
+
+    # Send note on (_MIDI_NOTE_ON) or note off (_MIDI_NOTE_OFF) of a note without the debug display (no allocation),
+    # a note out of 0..127 (a high scale plus the chord and the capo) is not sent
+    def key_send(self, status, note_key, velocity, channel, string, pad, ticks):
+        if note_key < 0 or note_key > 127:
+            return
+
+        if status == _MIDI_NOTE_ON:
+            if self.note_is_on(note_key, channel):
+                self.midi_write(_MIDI_NOTE_OFF, note_key, 0, channel)
+
+            if velocity > 0:
+                if self._continuous_held > 0:
+                    self.continuous_note_on(channel)
+
+                self.voice_on(note_key, velocity, channel, string, pad, ticks)
+            else:
+                self.voice_off(note_key, channel)
+
+            self.note_set_on(note_key, channel, velocity > 0)
+
+        else:
+            self.voice_off(note_key, channel)
+            self.note_set_on(note_key, channel, False)
+
+        self.midi_write(status, note_key, velocity, channel)
+        pico_led.value = status == _MIDI_NOTE_ON
 
     # Send note on
-    def set_note_on(self, note_key, velocity, channel=None):
+    def set_note_on(self, note_key, velocity, channel=None, string=_VOICE_NONE, pad=_VOICE_NONE):
         if channel is None:
             channel = self.midi_channel()
 
-        self.midi_send(NoteOn(note_key, velocity, channel=channel), channel)
+        self.note_send(_MIDI_NOTE_ON, note_key, velocity, channel, string, pad)
 
     # Send note off
     def set_note_off(self, note_key, channel=None):
         if channel is None:
             channel = self.midi_channel()
 
-        self.midi_send(NoteOff(note_key, channel=channel), channel)
+        self.note_send(_MIDI_NOTE_OFF, note_key, 0, channel)
 
-    # Send all notes off
+    # Send note off of all notes sounding in a channel (None is all channels)
     def set_all_notes_off(self, channel=None):
-        pass
+        for ch in range(16) if channel is None else (channel,):
+            note_key = self.next_note_on(ch, 0)
+            while note_key >= 0:
+                self.write_note_off(note_key, ch)
+                note_key = self.next_note_on(ch, note_key + 1)
+
+            # Clear the notes and the voices in the channel
+            for index in range(ch << 4, (ch + 1) << 4):
+                self._notes_on[index] = 0
+
+            for voice in range(VOICE_MAX):
+                if self._voice_keys[voice] != _VOICE_NONE and self._voice_channels[voice] == ch:
+                    self._voice_keys[voice] = _VOICE_NONE
+                    self._voice_count = self._voice_count - 1
+
+        self.pitch_classes_count()
+        pico_led.value = False
+
+    # Panic: note off of all notes sounding, then All Sound Off and All Notes Off in a channel (None is all channels),
+    # the controller values sent are forgotten to send them again
+    def panic(self, channel=None):
+        self.set_all_notes_off(channel)
+        for ch in range(16) if channel is None else (channel,):
+            self.write_control_change(120, 0, ch)		# All Sound Off
+            self.write_control_change(123, 0, ch)		# All Notes Off
+
+        self.controller_cache_clear()
             
 ##    def set_chorus(self, prog=None, level=None, feedback=None, delay=None, channel=None):
 ##        if channel is None:
@@ -608,8 +2203,7 @@ class USB_MIDI_Instrument_class:
         if channel is None:
             channel = self.midi_channel()
 
-        self._usb_midi[channel].send(ControlChange(1, value1_MSB, channel=channel))
-        self._usb_midi[channel].send(ControlChange(33, value33_LSB, channel=channel))
+        self.continuous_send(channel + 16, (value1_MSB << 7) | value33_LSB)
         return
 
     # Send program change
@@ -618,23 +2212,29 @@ class USB_MIDI_Instrument_class:
             if channel is None:
                 channel = self.midi_channel()
 
-            self.midi_send(ProgramChange(program, channel=channel), channel)
+            self.write_program_change(program, channel)
 
     # Send pitch bend value
     def set_pitch_bend(self, value, channel=None):
         if channel is None:
             channel = self.midi_channel()
 
-        self.midi_send(PitchBend(value, channel=channel), channel)
+        self.continuous_send(channel, value)
 
     # Send pitch bend range value
     def set_pitch_bend_range(self, value, channel=None):
         if channel is None:
             channel = self.midi_channel()
 
-        self.midi_send(ControlChange(0x65, 0, channel=channel), channel)			# RPN LSB
-        self.midi_send(ControlChange(0x64, 0, channel=channel), channel)			# RPN MSB
-        self.midi_send(ControlChange(0x06, value & 0x7f, channel=channel), channel)	# PRN DATA ENTRY
+        if self._rpn_pitch_bend_range[channel] == value & 0x7f:
+            self._controller_redundant = self._controller_redundant + 3
+            return
+
+        self._rpn_pitch_bend_range[channel] = value & 0x7f
+        self._controller_sent = self._controller_sent + 3
+        self.write_control_change(0x65, 0, channel)				# RPN LSB
+        self.write_control_change(0x64, 0, channel)				# RPN MSB
+        self.write_control_change(0x06, value & 0x7f, channel)	# PRN DATA ENTRY
     
 ##    def set_reverb(self, prog, level, feedback, channel=None):
 ##        pass
@@ -664,6 +2264,64 @@ class USB_MIDI_Instrument_class:
 ##################
 ### Guitar class
 ##################
+# Strum directions
+_STRUM_DOWN = const(0)				# 6th string to 1st string
+_STRUM_UP = const(1)				# 1st string to 6th string
+_STRUM_VELOCITY = const(2)			# Down if the strike is strong, up if weak
+_STRUM_ALTERNATE = const(3)			# Down and up alternately
+STRUM_DIRECTION_NAMES = ('DOWN', 'UP', 'VELOCITY', 'ALTERNATE')
+STRUM_VELOCITY_DOWN = 64			# Velocity to strum down in _STRUM_VELOCITY
+
+# Chord voicings cached (the chords on the buttons and in the music)
+VOICING_CACHE_SIZE = 32
+
+# Chord definitions, and the packed chord table made from them by tools/chord_table.py:
+#   'PGT2', size and checksum of the chord JSON file, number of chords, 6 open string notes (signed),
+#   chord names (length and ASCII), frets to press (signed, -1 is not to play) [root 0..11][chord][position 0..1][string 1..6]
+CHORD_JSON_FILE = 'SYNTH/MIDIFILE/chords.json'
+CHORD_TABLE_FILE = 'SYNTH/MIDIFILE/chords.bin'
+
+# Chord types not in the chord table, made by the voicing generator: intervals from the root (the 5th may be omitted)
+CHORD_FORMULAS = (
+    ('dim',   (0, 3, 6)),
+    ('sus2',  (0, 2, 7)),
+    ('9',     (0, 4, 7, 10, 2)),
+    ('M9',    (0, 4, 7, 11, 2)),
+    ('m9',    (0, 3, 7, 10, 2)),
+    ('11',    (0, 7, 10, 2, 5)),
+    ('13',    (0, 4, 10, 2, 9)),
+    ('add11', (0, 4, 7, 5)),
+)
+# Other chord types are parsed from these tokens in the chord name (longest first, like 'm11', '7b9', '6/9', 'M7#11'):
+# the 3rd, the 5th, the 7th or the 6th, and the tensions (None is not changed).
+# The 7th 0 is the 7th of 9, 11 and 13 (minor, major after 'M'), 1 makes the 7th major ('M9').
+CHORD_NAME_TOKENS = (
+    ('maj7', None, None, 11, ()), ('maj', None, None, 1, ()), ('add13', None, None, None, (9,)), ('add11', None, None, None, (5,)), ('add9', None, None, None, (2,)),
+    ('add6', None, None, None, (9,)), ('add4', None, None, None, (5,)), ('add2', None, None, None, (2,)),
+    ('sus2', 2, None, None, ()), ('sus4', 5, None, None, ()), ('sus', 5, None, None, ()), ('dim7', 3, 6, 9, ()), ('dim', 3, 6, None, ()),
+    ('aug', None, 8, None, ()), ('6/9', None, None, 9, (2,)), ('69', None, None, 9, (2,)),
+    ('#11', None, None, None, (6,)), ('+11', None, None, None, (6,)), ('b13', None, None, None, (8,)), ('-13', None, None, None, (8,)),
+    ('b5', None, 6, None, ()), ('-5', None, 6, None, ()), ('#5', None, 8, None, ()), ('+5', None, 8, None, ()),
+    ('b9', None, None, None, (1,)), ('-9', None, None, None, (1,)), ('#9', None, None, None, (3,)), ('+9', None, None, None, (3,)),
+    ('M7', None, None, 11, ()), ('13', None, None, 0, (2, 9)), ('11', None, None, 0, (2, 5)), ('9', None, None, 0, (2,)),
+    ('7', None, None, 10, ()), ('6', None, None, 9, ()), ('M', None, None, 1, ()), ('m', 3, None, None, ()), ('+', None, 8, None, ()),
+    ('(', None, None, None, ()), (')', None, None, None, ()), (',', None, None, None, ()),
+)
+# Tunings other than the chord table's standard tuning: name and notes of the open strings [1st..6th] (C4 is 0),
+# more tunings can be added in TUNING_JSON_FILE
+TUNINGS = (
+    ('DROP D', (16, 11, 7, 2, -3, -10)),
+    ('DADGAD', (14, 9, 7, 2, -3, -10)),
+    ('OPEN G', (14, 11, 7, 2, -5, -10)),
+)
+TUNING_JSON_FILE = 'SYNTH/MIDIFILE/tunings.json'
+
+CHORD_RECOGNIZE_INTERVAL = 200		# Minimum interval to display the chord sounding (msec)
+CHORD_RECOGNIZE_POLL = 50			# Interval to check the notes sounding (msec)
+CHORD_RECOGNIZE_ORDER = ('M', 'm', '7', 'm7', 'M7', 'sus4', '7sus4', 'dim', 'aug')	# Names preferred for the same notes (ex. Am rather than C6)
+VOICING_GENERATED_SIZE = 24			# Fret maps generated and memoized
+VOICING_FRETS = ((0, 5), (5, 14))	# Frets to press in the low and the high positions
+
 class Guitar_class:
     def __init__(self, display_obj):
         self._display = display_obj
@@ -673,16 +2331,42 @@ class Guitar_class:
 #        self.PARAM_GUITAR_CHORDs = ['M', 'M7', '7', '6', 'aug', 'm', 'mM7', 'm7', 'm6', 'm7-5', 'add9', 'sus4', '7sus4', 'dim7']
 #        self.GUITAR_STRINGS_OPEN = [16,11, 7, 2, -3, -8]	# 1st String: E, B, G, D, A, E: 6th String
 
-        #Chord   : LO:1  2  3  4  5  6  HI:1  2  3  4  5  6				# Strings
-        #  {'CM' : ([ 0, 1, 0, 2, 3,-1], [ 3, 5, 5, 5, 3,-1]),...}		# Fret number to press (-1 is not to play it)
-        self.PARAM_GUITAR_CHORDs = None
-        self.GUITAR_STRINGS_OPEN = None
-        self.CHORD_STRUCTURE = None
-        with open('SYNTH/MIDIFILE/chords.json', 'r') as f:
-            data = json.load(f)
-            self.PARAM_GUITAR_CHORDs = data['CHORDS']				# M, M7, ...
-            self.GUITAR_STRINGS_OPEN = data['STRING_NOTES']			# Note offset of Strings [1..6] opened (B=-1,C=0,C#=1)
-            self.CHORD_STRUCTURE = data['CHORD_DEFINITIONS']		# Positions to press frets for each chord
+        # Chord table (packed frets to press for each chord, no dictionary of chord names)
+        self.PARAM_GUITAR_CHORDs = None			# M, M7, ...
+        self.GUITAR_STRINGS_OPEN = None			# Note offset of Strings [1..6] opened (B=-1,C=0,C#=1)
+        self._chord_table = None
+        self._table_chords = 0					# Chords in the table (the others are generated)
+        self.load_chord_table()
+
+        # Chord types generated from CHORD_FORMULAS follow the chord types in the table
+        self._generated_frets = {}
+        for chord_name, intervals in CHORD_FORMULAS:
+            if chord_name not in self.PARAM_GUITAR_CHORDs:
+                self.PARAM_GUITAR_CHORDs.append(chord_name)
+
+        # Chord recognition index: [pitch classes mask * 2] = root, [pitch classes mask * 2 + 1] = chord + 1 (0 is unknown)
+        self._chord_index = bytearray(4096 * 2)
+        self.chord_index_build()
+        self._pitch_classes_shown = -1			# Pitch classes sounding on the display
+        self._pitch_classes_ticks = 0			# Ticks when the chord sounding was displayed
+        self._pitch_classes_dirty = False		# Notes sounding changed and not displayed yet
+
+        # Chord voicings (notes of 6 strings and the on-note) cached by voicing_key(), and the current chord's one
+        self._voicings = {}
+        self._voicing = None
+
+        # Tunings ([name, open string notes]) and the voicing cache of each tuning (None is not made yet)
+        self._tunings = [['STANDARD', self.GUITAR_STRINGS_OPEN]]
+        for tuning_name, notes in TUNINGS:
+            self._tunings.append([tuning_name, list(notes)])
+
+        self.load_tunings(TUNING_JSON_FILE)
+        self._tuning = 0
+        self._tuning_notes = self.GUITAR_STRINGS_OPEN
+        self._tuning_shift = 0					# Transpose of the tuning (all strings shifted the same)
+        self._tuning_retuned = [False] * 6		# Strings retuned from the standard tuning (transposed)
+        self._tuning_voicings = [None] * len(self._tunings)
+        self._tuning_voicings[0] = self._voicings
 
         self.PARAM_ALL = -1
         self.PARAM_GUITAR_PROGRAM = 0
@@ -694,6 +2378,7 @@ class Guitar_class:
         self.PARAM_GUITAR_ONCHORD = 6
         self.PARAM_GUITAR_DRUM_NAME = 7
         self.PARAM_MUSIC_INFO = 8
+        self.PARAM_GUITAR_SOUNDING = 9
         
         self.value_guitar_root = 0		# Current root
         self.value_guitar_chord = 0		# Current chord
@@ -746,6 +2431,30 @@ class Guitar_class:
 #            self._drum_insts = json_data
             for inst in json_data:
                 self._drum_insts.append(inst['NOTE'])
+
+        # Scan timing histogram shown (SCAN or GAP)
+        self._timing_histogram = _SCAN_TIMING_SCAN
+
+        # Strum settings
+        self._strum_direction = _STRUM_DOWN
+        self._strum_spacing = 0					# msec between strings (0 plays all notes at once)
+        self._strum_taper = 0					# Velocity decrease for each string
+        self._strum_down = False				# Last strum was down
+
+        # Strum in progress: note keys and velocities in the order to play
+        self._strum_keys = bytearray(7)
+        self._strum_velocities = bytearray(7)
+        self._strum_strings = bytearray(7)
+        self._strum_size = 0
+        self._strum_next = 0					# Next note to play
+        self._strum_ticks = 0					# Ticks when the strum started
+        self._strum_channel = 0
+
+        # Release: let ring (False) or mute with note off (True)
+        self._release_mute = False
+
+        # Voicings of the chord buttons
+        self.voicing_cache_fill()
             
         self._drum_list = []
         self._drum_file_num = -1
@@ -773,6 +2482,7 @@ class Guitar_class:
         input_device.device_alias('GUITAR_CHORD_FILE', 'BUTTON_7')
 
         # Device aliases for config mode
+        input_device.device_alias('GUITAR_CC_INTERVAL',      'BUTTON_1')
         input_device.device_alias('GUITAR_BASE_VOLUME',      'BUTTON_2')
         input_device.device_alias('GUITAR_VELOCITY_CURVE',   'BUTTON_3')
         input_device.device_alias('GUITAR_PITCH_BEND_RANGE', 'BUTTON_4')
@@ -788,6 +2498,21 @@ class Guitar_class:
         input_device.device_alias('GUITAR_DRUM_SELECT',      'BUTTON_7')
         input_device.device_alias('GUITAR_DRUM_NOTE',        'BUTTON_1')
 
+        input_device.device_alias('GUITAR_STRIKE_WINDOW',    'BUTTON_2')
+        input_device.device_alias('GUITAR_CALIBRATE',        'BUTTON_3')
+        input_device.device_alias('GUITAR_CROSSTALK',        'BUTTON_4')
+        input_device.device_alias('GUITAR_HOLDOFF',          'BUTTON_5')
+        input_device.device_alias('GUITAR_ADC_RECORD',       'BUTTON_6')
+        input_device.device_alias('GUITAR_LATENCY_TRACE',    'BUTTON_7')
+
+        input_device.device_alias('GUITAR_STRUM_DIRECTION',  'BUTTON_1')
+        input_device.device_alias('GUITAR_STRUM_SPACING',    'BUTTON_2')
+        input_device.device_alias('GUITAR_STRUM_TAPER',      'BUTTON_3')
+        input_device.device_alias('GUITAR_POLYPHONY',        'BUTTON_4')
+        input_device.device_alias('GUITAR_VOICE_STEAL',      'BUTTON_5')
+        input_device.device_alias('GUITAR_RELEASE',          'BUTTON_6')
+        input_device.device_alias('GUITAR_TUNING',           'BUTTON_7')
+
         # Device aliases for music mode
         input_device.device_alias('GUITAR_CHORD_NEXT', 'BUTTON_1')
         input_device.device_alias('GUITAR_MUSIC_PREV', 'BUTTON_2')
@@ -796,6 +2521,13 @@ class Guitar_class:
         input_device.device_alias('GUITAR_CHORD_TOP',  'BUTTON_6')
         input_device.device_alias('GUITAR_CHORD_LAST', 'BUTTON_7')
 
+        # Device aliases for scan timing mode
+        input_device.device_alias('GUITAR_TIMING_REFRESH',   'BUTTON_1')
+        input_device.device_alias('GUITAR_TIMING_HISTOGRAM', 'BUTTON_2')
+        input_device.device_alias('GUITAR_TIMING_RESET',     'BUTTON_3')
+        input_device.device_alias('GUITAR_TIMING_DUMP',      'BUTTON_4')
+        input_device.device_alias('GUITAR_TIMING_ALLOC',     'BUTTON_5')
+
     def setup(self):
         display.fill(0)
         synth.set_program_change(self.program_number()[1])
@@ -818,10 +2550,22 @@ class Guitar_class:
         display.fill(0)
         self.show_info_config2(self.PARAM_ALL, 1)
 
+    def setup_config3(self):
+        display.fill(0)
+        self.show_info_config3(self.PARAM_ALL, 1)
+
+    def setup_config4(self):
+        display.fill(0)
+        self.show_info_config4(self.PARAM_ALL, 1)
+
     def setup_music(self):
         display.fill(0)
         self.show_info_music(self.PARAM_ALL, 1)
 
+    def setup_timing(self):
+        display.fill(0)
+        self.show_info_timing(self.PARAM_ALL, 1)
+
     def midi_channel(self, channel=None):
         if channel is not None:
             self._midi_channel = channel % 16
@@ -942,8 +2686,7 @@ class Guitar_class:
                 index = self.PARAM_GUITAR_ROOTs.index(data) if data in self.PARAM_GUITAR_ROOTs else 0
                 self._chord_on_button[cd]['ROOT'] = index
 
-                data = 'M' if len(chord[1]) == 0 else chord[1]
-                index = self.PARAM_GUITAR_CHORDs.index(data) if data in self.PARAM_GUITAR_CHORDs else 0
+                (index, slash_note) = self.chord_type(chord[1])
                 self._chord_on_button[cd]['CHORD'] = index
 
                 data = 'LOW' if len(chord[1]) == 0 else chord[2]
@@ -953,12 +2696,14 @@ class Guitar_class:
                 if data in self.PARAM_GUITAR_ROOTs:
                     index = self.PARAM_GUITAR_ROOTs.index(data) if data in self.PARAM_GUITAR_ROOTs else 0
                 else:
-                    index = -1
+                    index = slash_note
                     
                 self._chord_on_button[cd]['ON_NOTE'] = index
                 
                 self._chord_on_button[cd]['SCALE'] = chord[4]
                         
+            self.voicing_cache_invalidate()
+            self.voicing_cache_fill()
             return self._chord_file_num
 
         except Exception as e:
@@ -1000,10 +2745,14 @@ class Guitar_class:
             self._music = []
             for chord in json_data['MUSIC']:
                 chord[0] = self.PARAM_GUITAR_ROOTs.index(chord[0]) if chord[0] in self.PARAM_GUITAR_ROOTs else 0
-                chord[1] = self.PARAM_GUITAR_CHORDs.index(chord[1]) if chord[1] in self.PARAM_GUITAR_CHORDs else 0
+                (chord[1], slash_note) = self.chord_type(chord[1])
                 chord[2] = 1 if chord[2] == 'HIGH' else 0
-                chord[3] = self.PARAM_GUITAR_ROOTs.index(chord[3]) if chord[3] in self.PARAM_GUITAR_ROOTs else -1
+                chord[3] = self.PARAM_GUITAR_ROOTs.index(chord[3]) if chord[3] in self.PARAM_GUITAR_ROOTs else slash_note
                 self._music.append(chord)
+
+                # Generate the frets before playing
+                if chord[1] >= self._table_chords:
+                    self.chord_frets(chord[0], chord[1], chord[2])
             
             if len(self._music) > 0:
                 self._music.append([-1, -1, 0, -1])		# Sign at the end of music
@@ -1031,6 +2780,7 @@ class Guitar_class:
                 self._chord_position      = chord[2]	# 0: Low chord, 1: High chord
                 self.value_guitar_on_note = chord[3]	# on-note
                 self._scale_number        = chord[4]	# Scale
+                self.select_voicing()
 
         return self._music_chord_num
 
@@ -1071,16 +2821,18 @@ class Guitar_class:
         self.value_guitar_on_note = button_data['ON_NOTE']	# On note
         self._chord_position = button_data['POSITION']		# 0: Low chord, 1: High chord
         self._scale_number = button_data['SCALE']
+        self.select_voicing()
 
     def guitar_string_note(self, strings, frets):
         if frets < 0:
             return None
         
-        return self.GUITAR_STRINGS_OPEN[strings] + frets
+        return self._tuning_notes[strings] + frets
 
     def scale_number(self, scale=None):
         if scale is not None:
             self._scale_number = scale % 9
+            self.select_voicing()
             
         return self._scale_number
 
@@ -1088,6 +2840,7 @@ class Guitar_class:
         if pos is not None:
             pos = pos % 2                
             self._chord_position = pos
+            self.select_voicing()
         
         return self._chord_position
     
@@ -1114,55 +2867,545 @@ class Guitar_class:
 #        print('CHORD NAME: ', chord_name, self.CHORD_STRUCTURE[chord_name][chord_position])
         return (root_name, chord_name)
 
+    # Notes of 6 strings and the on-note (-1 is no note) of the current chord or the chord given,
+    # the list returned is in the voicing cache (do not change it)
     def chord_notes(self, chord_position=None, root=None, chord=None, scale=None):
+        if chord_position is None and root is None and chord is None and scale is None:
+            return self._voicing
+
         if chord_position is None:
             chord_position = self.chord_position()
             
-        (root_name, chord_name) = self.chord_name(chord_position, root, chord, scale)
-            
+        if root is None:
+            root = self.root_note(scale)
+
+        if chord is None:
+            chord = self.value_guitar_chord
+
+        return self.voicing(root % 12, chord, chord_position, self._scale_number, self.value_guitar_on_note)
+
+    # Load the chord table from the packed file, or make it from the chord definitions if the file is older
+    # Load the packed chord table if it is made from the chord JSON file now (the same size and checksum),
+    # or the chord JSON file (the packed chord table is made again if the file system is writable)
+    def load_chord_table(self):
+        self._chord_json_signature = self.chord_json_signature(CHORD_JSON_FILE)
+        try:
+            if self.load_packed_chord_table(CHORD_TABLE_FILE):
+                return
+
+        except Exception as e:
+#            print(e, CHORD_TABLE_FILE)
+            pass
+
+        #Chord   : LO:1  2  3  4  5  6  HI:1  2  3  4  5  6				# Strings
+        #  {'CM' : ([ 0, 1, 0, 2, 3,-1], [ 3, 5, 5, 5, 3,-1]),...}		# Fret number to press (-1 is not to play it)
+        with open(CHORD_JSON_FILE, 'r') as f:
+            data = json.load(f)
+            self.PARAM_GUITAR_CHORDs = data['CHORDS']
+            self.GUITAR_STRINGS_OPEN = data['STRING_NOTES']
+            self._table_chords = len(self.PARAM_GUITAR_CHORDs)
+            self._chord_table = bytearray(12 * len(self.PARAM_GUITAR_CHORDs) * 12)
+            for root in range(12):
+                for chord in range(len(self.PARAM_GUITAR_CHORDs)):
+                    positions = data['CHORD_DEFINITIONS'][self.PARAM_GUITAR_ROOTs[root] + self.PARAM_GUITAR_CHORDs[chord]]
+                    for position in range(2):
+                        index = self.chord_table_index(root, chord, position)
+                        for string in range(6):
+                            self._chord_table[index + string] = positions[position][string] & 0xff
+
+        data = None
+        gc.collect()
+        print('CHORD TABLE: ' + CHORD_TABLE_FILE + ' is not made from ' + CHORD_JSON_FILE + (', made again' if self.save_chord_table(CHORD_TABLE_FILE) else ', run tools/chord_table.py'))
+
+    # Size and checksum (Fletcher-16) of the chord JSON file, the packed chord table made from it has them
+    def chord_json_signature(self, file_name):
+        size = 0
+        sum1 = 0
+        sum2 = 0
+        buf = bytearray(256)
+        with open(file_name, 'rb') as f:
+            num = f.readinto(buf)
+            while num:
+                for pos in range(num):
+                    sum1 = (sum1 + buf[pos]) % 255
+                    sum2 = (sum2 + sum1) % 255
+
+                size = size + num
+                num = f.readinto(buf)
+
+        return (size, (sum2 << 8) | sum1)
+
+    # Load the packed chord table made from the chord JSON file now:
+    #   'PGT2', JSON file size (4 bytes), JSON checksum (2 bytes), number of chords, STRING_NOTES (6 bytes),
+    #   chord names (length and ASCII), frets (12 roots * chords * 2 positions * 6 strings)
+    def load_packed_chord_table(self, file_name):
+        with open(file_name, 'rb') as f:
+            data = f.read()
+
+        (size, checksum) = self._chord_json_signature
+        if data[0:4] != b'PGT2' or data[4] | (data[5] << 8) | (data[6] << 16) | (data[7] << 24) != size or data[8] | (data[9] << 8) != checksum:
+            return False
+
+        chords = data[10]
+        self.GUITAR_STRINGS_OPEN = [note - 256 if note >= 128 else note for note in data[11:17]]
+        self.PARAM_GUITAR_CHORDs = []
+        pos = 17
+        for chord in range(chords):
+            self.PARAM_GUITAR_CHORDs.append(str(data[pos + 1:pos + 1 + data[pos]], 'ascii'))
+            pos = pos + 1 + data[pos]
+
+        self._chord_table = bytearray(data[pos:])
+        self._table_chords = chords
+        return len(self._chord_table) == 12 * chords * 12
+
+    # Save the chord table in the packed file
+    def save_chord_table(self, file_name):
+        try:
+            (size, checksum) = self._chord_json_signature
+            with open(file_name, 'wb') as f:
+                f.write(b'PGT2')
+                f.write(bytes([size & 0xff, (size >> 8) & 0xff, (size >> 16) & 0xff, size >> 24, checksum & 0xff, checksum >> 8]))
+                f.write(bytes([self._table_chords] + [note & 0xff for note in self.GUITAR_STRINGS_OPEN]))
+                for chord_name in self.PARAM_GUITAR_CHORDs[0:self._table_chords]:
+                    f.write(bytes([len(chord_name)]) + chord_name.encode('ascii'))
+
+                f.write(self._chord_table)
+
+            return True
+
+        except Exception as e:
+#            print(e, file_name)
+            return False
+
+    # Index of the frets of 6 strings in the chord table
+    def chord_table_index(self, root, chord, position):
+        return ((root * self._table_chords + chord) * 2 + position) * 6
+
+    # Fret to press on a string (0..5) for a chord (-1 is not to play the string)
+    def chord_fret(self, root, chord, position, string):
+        if chord < self._table_chords:
+            fret = self._chord_table[((root * self._table_chords + chord) * 2 + position) * 6 + string]
+            return fret - 256 if fret >= 128 else fret
+
+        (frets, index) = self.chord_frets(root, chord, position)
+        fret = frets[index + string]
+        return fret - 256 if fret >= 128 else fret
+
+    # Frets of 6 strings (signed bytes) for a chord: (bytes, index of the 1st string),
+    # from the chord table or the voicing generator
+    def chord_frets(self, root, chord, position):
+        if chord < self._table_chords:
+            return (self._chord_table, ((root * self._table_chords + chord) * 2 + position) * 6)
+
+        key = (root * len(self.PARAM_GUITAR_CHORDs) + chord) * 2 + position
+        frets = self._generated_frets.get(key)
+        if frets is None:
+            if len(self._generated_frets) >= VOICING_GENERATED_SIZE:
+                self._generated_frets.clear()
+
+            frets = self.generate_frets(root, chord, position)
+            self._generated_frets[key] = frets
+
+        return (frets, 0)
+
+    # Chord type index of a chord name, a slash chord like '9/F#' returns the on-note too: (chord, on-note or -1).
+    # A chord type not known yet is added if its name can be parsed (see chord_formula()),
+    # or it is played as major (0) and printed to the serial console.
+    def chord_type(self, chord_name):
+        on_note = -1
+        slash = chord_name.rfind('/')
+        if slash >= 0 and chord_name[slash + 1:] in self.PARAM_GUITAR_ROOTs:
+            on_note = self.PARAM_GUITAR_ROOTs.index(chord_name[slash + 1:])
+            chord_name = chord_name[0:slash]
+
+        if chord_name == '':
+            chord_name = 'M'
+
+        if chord_name in self.PARAM_GUITAR_CHORDs:
+            return (self.PARAM_GUITAR_CHORDs.index(chord_name), on_note)
+
+        if self.chord_formula(chord_name) is None:
+            print('CHORD TYPE: unknown ' + chord_name + ', played as major')
+            return (0, on_note)
+
+        # The voicing keys depend on the number of the chord types
+        self.PARAM_GUITAR_CHORDs.append(chord_name)
+        self._generated_frets.clear()
+        self.voicing_cache_invalidate()
+        return (len(self.PARAM_GUITAR_CHORDs) - 1, on_note)
+
+    # Intervals from the root of a chord type generated: (root, 3rd, 5th, 7th or 6th, tensions), None is unknown.
+    # CHORD_FORMULAS first, or parsed from the tokens in CHORD_NAME_TOKENS (9, 11 and 13 add the 7th).
+    def chord_formula(self, chord_name):
+        for name, formula in CHORD_FORMULAS:
+            if name == chord_name:
+                return formula
+
+        third = 4
+        fifth = 7
+        seventh = -1
+        major_seventh = False
+        tensions = []
+        pos = 0
+        while pos < len(chord_name):
+            for (token, token_third, token_fifth, token_seventh, token_tensions) in CHORD_NAME_TOKENS:
+                if chord_name.startswith(token, pos):
+                    break
+            else:
+                return None
+
+            pos = pos + len(token)
+            if token_third is not None:
+                third = token_third
+
+            if token_fifth is not None:
+                fifth = token_fifth
+
+            if token_seventh == 1:
+                major_seventh = True
+
+            elif token_seventh == 0:
+                if seventh < 0:
+                    seventh = 11 if major_seventh else 10
+
+            elif token_seventh is not None:
+                seventh = 11 if token_seventh == 10 and major_seventh else token_seventh
+
+            for tension in token_tensions:
+                if tension not in tensions:
+                    tensions.append(tension)
+
+        intervals = [0, third, fifth]
+        if seventh >= 0:
+            intervals.append(seventh)
+
+        for tension in tensions:
+            if tension not in intervals:
+                intervals.append(tension)
+
+        return tuple(intervals)
+
+    # Load the tunings defined by a user: [{"NAME": name, "STRING_NOTES": [1st..6th]}, ...]
+    def load_tunings(self, file_name):
+        try:
+            with open(file_name, 'r') as f:
+                for tuning in json.load(f):
+                    if len(tuning['STRING_NOTES']) == 6:
+                        self._tunings.append([tuning['NAME'], tuning['STRING_NOTES']])
+
+        except Exception as e:
+#            print(e, file_name)
+            return
+
+    # Tuning (0 is the standard tuning of the chord table), the voicings are made for each tuning and cached
+    def tuning(self, tuning_num=None):
+        if tuning_num is not None:
+            self._tuning = tuning_num % len(self._tunings)
+            self._tuning_notes = self._tunings[self._tuning][1]
+            (self._tuning_shift, self._tuning_retuned) = self.tuning_offsets(self._tuning_notes)
+            self._voicings = self._tuning_voicings[self._tuning]
+            if self._voicings is None:
+                self._voicings = {}
+                self._tuning_voicings[self._tuning] = self._voicings
+                self.voicing_cache_fill()
+
+            else:
+                self.select_voicing()
+
+        return self._tuning
+
+    def tuning_name(self):
+        return self._tunings[self._tuning][0]
+
+    # Transpose (semitones) of the tuning if all strings are shifted from the standard tuning the same (0 if not),
+    # and the strings retuned from the standard tuning transposed
+    def tuning_offsets(self, notes):
+        shift = notes[0] - self.GUITAR_STRINGS_OPEN[0]
+        for strings in range(6):
+            if notes[strings] - self.GUITAR_STRINGS_OPEN[strings] != shift:
+                shift = 0
+
+        return (shift, [notes[strings] - self.GUITAR_STRINGS_OPEN[strings] != shift for strings in range(6)])
+
+    # Fret on a retuned string sounding a chord tone (tones: pitch classes mask, the tones not sounded yet first):
+    # the open string in the low position, or the fret nearest to the fret in the chord table (the lower first),
+    # the lowest string keeps the pitch class of the bass
+    def tuning_fret(self, string, fret, tones, sounded, position, bass_class):
+        open_note = self._tuning_notes[string]
+        for mask in ((1 << bass_class,) if bass_class >= 0 else (tones & ~sounded, tones)):
+            if position == 0 and mask & (1 << (open_note % 12)):
+                return 0
+
+            for distance in range(6):
+                if fret - distance >= 0 and mask & (1 << ((open_note + fret - distance) % 12)):
+                    return fret - distance
+
+                if mask & (1 << ((open_note + fret + distance) % 12)):
+                    return fret + distance
+
+        return fret
+
+    # Make the chord recognition index from the chord table (the pitch classes of the frets on STRING_NOTES)
+    # and CHORD_FORMULAS (with and without the 5th), the chord types in CHORD_RECOGNIZE_ORDER come first
+    def chord_index_build(self):
+        chords = [self.PARAM_GUITAR_CHORDs.index(chord_name) for chord_name in CHORD_RECOGNIZE_ORDER if chord_name in self.PARAM_GUITAR_CHORDs]
+        chords = chords + [chord for chord in range(len(self.PARAM_GUITAR_CHORDs)) if chord not in chords]
+        for chord in chords:
+            for root in range(12):
+                if chord < self._table_chords:
+                    for position in range(2):
+                        mask = 0
+                        index = self.chord_table_index(root, chord, position)
+                        for string in range(6):
+                            fret = self._chord_table[index + string]
+                            if fret < 128:
+                                mask = mask | (1 << ((self.GUITAR_STRINGS_OPEN[string] + fret) % 12))
+
+                        self.chord_index_add(mask, root, chord)
+
+                else:
+                    for chord_name, intervals in CHORD_FORMULAS:
+                        if chord_name == self.PARAM_GUITAR_CHORDs[chord]:
+                            mask = 0
+                            for interval in intervals:
+                                mask = mask | (1 << ((root + interval) % 12))
+
+                            self.chord_index_add(mask, root, chord)
+                            if 7 in intervals:
+                                self.chord_index_add(mask & ~(1 << ((root + 7) % 12)), root, chord)
+
+    def chord_index_add(self, mask, root, chord):
+        if mask != 0 and self._chord_index[mask * 2 + 1] == 0:
+            self._chord_index[mask * 2] = root
+            self._chord_index[mask * 2 + 1] = chord + 1
+
+    # Chord of the pitch classes sounding (12 bits mask, bit 0 is C): root * 256 + chord, -1 is unknown
+    def chord_recognize(self, mask):
+        chord = self._chord_index[mask * 2 + 1]
+        return -1 if chord == 0 else self._chord_index[mask * 2] * 256 + chord - 1
+
+    # Generate the frets of a chord type in CHORD_FORMULAS:
+    # the root on the lowest string played (6th..4th), the strings above it played except the 1st and the 2nd,
+    # all tones except the 5th, 4 fingers at most (a barre is a finger) within 4 frets.
+    # If not playable in the position, the other position is tried, then only the root and the 2nd tone
+    # in the formula (3rd or the tension) are required, at last the major chord is played (never all muted)
+    def generate_frets(self, root, chord, position):
+        intervals = self.chord_formula(self.PARAM_GUITAR_CHORDs[chord])
+        if intervals is None:
+            intervals = (0, 4, 7)
+
+        tones = 0
+        required = 0
+        for interval in intervals:
+            tones = tones | (1 << ((root + interval) % 12))
+            if interval != 7:
+                required = required | (1 << ((root + interval) % 12))
+
+        relaxed = (1 << (root % 12)) | (1 << ((root + intervals[1]) % 12))
+        for (tones_required, fret_position) in ((required, position), (required, 1 - position), (relaxed, position), (relaxed, 1 - position)):
+            frets = self.generate_search(root, tones, tones_required, fret_position)
+            if frets is not None:
+                return bytes([fret & 0xff for fret in frets])
+
+        (table, index) = self.chord_frets(root, 0, position)
+        return bytes(table[index:index + 6])
+
+    # Search the frets in a position playing the required tones with the best score (None is not found)
+    def generate_search(self, root, tones, required, position):
+        # Frets to play the chord tones on each string
+        (low_fret, high_fret) = VOICING_FRETS[position]
+        candidates = []
+        for string in range(6):
+            frets = [-1] if string <= 1 else []
+            for fret in ([0] if position == 0 else []) + list(range(max(low_fret, 1), high_fret + 1)):
+                if tones & (1 << ((self.GUITAR_STRINGS_OPEN[string] + fret) % 12)):
+                    frets.append(fret)
+
+            candidates.append(frets)
+
+        best = (None, -1)
+        for lowest in (5, 4, 3):
+            for bass in candidates[lowest]:
+                if bass >= 0 and (self.GUITAR_STRINGS_OPEN[lowest] + bass) % 12 == root % 12:
+                    frets = [-1] * 6
+                    frets[lowest] = bass
+                    best = self.generate_strings(frets, lowest - 1, bass if bass > 0 else 99, bass, candidates, required, best)
+
+        return best[0]
+
+    # Try the frets on the strings from a string to the 1st string, skip the frets out of 4 frets span
+    # best: (frets, score) found so far
+    def generate_strings(self, frets, string, pressed_min, pressed_max, candidates, required, best):
+        if string < 0:
+            score = self.voicing_score(frets, required)
+            return (list(frets), score) if score > best[1] else best
+
+        for fret in candidates[string]:
+            if fret > 0 and max(pressed_max, fret) - min(pressed_min, fret) > 3:
+                continue
+
+            # Not to play the 1st string over the muted 2nd string
+            if fret >= 0 and string == 0 and frets[1] < 0:
+                continue
+
+            frets[string] = fret
+            best = self.generate_strings(frets, string - 1, min(pressed_min, fret) if fret > 0 else pressed_min, max(pressed_max, fret), candidates, required, best)
+
+        frets[string] = -1
+        return best
+
+    # Score of the frets (-1 is not playable), more strings, more tones and fewer fingers are better
+    def voicing_score(self, frets, required):
+        played = 0
+        pitch_classes = 0
+        pressed_min = 99
+        pressed_max = 0
+        for string in range(6):
+            fret = frets[string]
+            if fret >= 0:
+                played = played + 1
+                pitch_classes = pitch_classes | (1 << ((self.GUITAR_STRINGS_OPEN[string] + fret) % 12))
+                if fret > 0:
+                    pressed_min = min(pressed_min, fret)
+                    pressed_max = max(pressed_max, fret)
+
+        if pitch_classes & required != required:
+            return -1
+
+        fingers = 0
+        if pressed_max > 0:
+            if pressed_max - pressed_min > 3:
+                return -1
+
+            barre = 0
+            for fret in frets:
+                if fret > pressed_min:
+                    fingers = fingers + 1
+                elif fret == pressed_min:
+                    barre = 1
+
+            fingers = fingers + barre
+            if fingers > 4:
+                return -1
+
+        tones = 0
+        while pitch_classes:
+            tones = tones + (pitch_classes & 1)
+            pitch_classes = pitch_classes >> 1
+
+        return played * 100 + tones * 10 - fingers * 2 - (pressed_max - pressed_min if pressed_max > 0 else 0)
+
+    # Key of a voicing in the cache (root: 0..11, scale: octave 0..8, on_note: -1..11)
+    def voicing_key(self, root, chord, position, scale, on_note):
+        return ((((root * len(self.PARAM_GUITAR_CHORDs) + chord) * 2 + position) * 9 + scale) * 13) + on_note + 1
+
+    # Voicing of a chord from the cache, it is made if not in the cache
+    def voicing(self, root, chord, position, scale, on_note):
+        key = self.voicing_key(root, chord, position, scale, on_note)
+        notes = self._voicings.get(key)
+        if notes is None:
+            if len(self._voicings) >= VOICING_CACHE_SIZE:
+                self._voicings.clear()
+
+            notes = self.make_voicing(root, chord, position, scale, on_note)
+            self._voicings[key] = notes
+
+        return notes
+
+    # Make a voicing: notes of 6 strings and the on-note on the current tuning
+    def make_voicing(self, root, chord, position, scale, on_note):
 #        print('CHORD NAME: ', chord_name, self.CHORD_STRUCTURE[chord_name][chord_position])
-        root_mod = -1 if self.value_guitar_on_note < 0 else self.PARAM_GUITAR_ROOTs.index(root_name) % 12
-        notes = []
-        fret_map = self.CHORD_STRUCTURE[chord_name][chord_position]
-#        for strings in list(range(6)):
-        for strings in list(range(5, -1, -1)):
-            note = self.guitar_string_note(strings, fret_map[strings])
-            if note is not None:
-                # Replace the root note with the on-chord note
-                if note % 12 == root_mod:
-                    notes.insert(0, -1)
-                    root_mod = -1
+        shift = self._tuning_shift
+        root_class = (root + shift) % 12
+        if on_note >= 0:
+            on_note = on_note + shift
+
+        root_mod = -1 if on_note < 0 else root_class
+        notes = [-1] * 7
+        octave_note = (scale + 1) * 12
+        (table, index) = self.chord_frets(root, chord, position)
+
+        # Chord tones of the frets in the standard tuning (transposed as the tuning)
+        tones = 0
+        for strings in range(6):
+            fret = table[index + strings]
+            if fret < 128:
+                tones = tones | (1 << ((self.GUITAR_STRINGS_OPEN[strings] + fret + shift) % 12))
+
+        # A string tuned as the standard tuning (or transposed with all strings) plays the fret in the chord table,
+        # a retuned string plays the fret sounding a chord tone (see tuning_fret()),
+        # a muted retuned string plays the open string sounding a chord tone in the low position (only the root under the lowest string)
+        bass = True
+        sounded = 0
+        for strings in range(5, -1, -1):
+            fret = table[index + strings]
+            if fret >= 128:
+                fret = fret - 256
+
+            if self._tuning_retuned[strings]:
+                if fret >= 0:
+                    fret = self.tuning_fret(strings, fret, tones, sounded, position, (self.GUITAR_STRINGS_OPEN[strings] + fret + shift) % 12 if bass else -1)
+
+                elif position == 0:
+                    pitch_class = self._tuning_notes[strings] % 12
+                    if (pitch_class == root_class) if bass else (tones & (1 << pitch_class)):
+                        fret = 0
+
+            if fret >= 0:
+                notes[strings] = self.guitar_string_note(strings, fret) + octave_note
+                sounded = sounded | (1 << (notes[strings] % 12))
+                bass = False
+
+        # Replace the root note with the on-chord note
+        if root_mod >= 0:
+            for strings in range(5, -1, -1):
+                if notes[strings] >= 0 and notes[strings] % 12 == root_mod:
+                    notes[strings] = -1
 #                    print('IGNORE ROOT for ON-NOTE:', note + (self._scale_number + 1) * 12, self.value_guitar_on_note)
-                else:
-                    notes.insert(0, note + (self._scale_number + 1) * 12)
-            else:
-                notes.insert(0, -1)
+                    break
         
-        # Simple chord
-        if self.value_guitar_on_note < 0:
-            notes.append(-1)
-            
         # A chord with on-note like C on D
-        else:
+        if on_note >= 0:
             # Make a base note
-            on_note = self.value_guitar_on_note + (self._scale_number + 1) * 12
-            if on_note in notes:
-                notes.append(self.value_guitar_on_note + self._scale_number * 12)
+            if on_note + octave_note in notes:
+                notes[6] = on_note + scale * 12
             else:
-                notes.append(self.value_guitar_on_note + (self._scale_number + 1) * 12)
+                notes[6] = on_note + octave_note
             
         return notes
 
+    # Select the voicing of the current chord
+    def select_voicing(self):
+        self._voicing = self.voicing(self.value_guitar_root, self.value_guitar_chord, self._chord_position, self._scale_number, self.value_guitar_on_note)
+
+    # Clear the voicing caches of all tunings (the chord set is changed),
+    # the caches of the other tunings are made again when the tuning is selected
+    def voicing_cache_invalidate(self):
+        self._voicings.clear()
+        for tuning in range(len(self._tuning_voicings)):
+            if tuning != self._tuning:
+                self._tuning_voicings[tuning] = None
+
+    # Make the voicings of the chord buttons in the cache of the current tuning
+    def voicing_cache_fill(self):
+        for button_data in self._chord_on_button:
+            self.voicing(button_data['ROOT'], button_data['CHORD'], button_data['POSITION'], button_data['SCALE'], button_data['ON_NOTE'])
+
+        self.select_voicing()
+
     # Play a string
     def play_a_string(self, string, string_velocity, channel=None):
 #        print('PLAY a STRING VELO:', string_velocity)
+        alloc_accounting = scan_timing.alloc_accounting()
+        if alloc_accounting:
+            start_alloc = gc.mem_alloc()
+
         if channel is None:
             channel = self.midi_channel()
 
         # Play strings in the current chord
         if self.drum_mode() == False:
-            string_notes = self.chord_notes()
-            chord_note = string_notes[string]
+            chord_note = self._voicing[string]
             capo = self.capotasto()
         
         # Drum set
@@ -1177,55 +3420,138 @@ class Guitar_class:
         if chord_note >= 0:
             # Note on
             if string_velocity > 0:
+                latency_tracer.trace(_TRACE_RESOLVED, 5 - string, _MIDI_NOTE_ON | channel, chord_note + capo)
                 velocity = string_velocity + self.offset_velocity()
-                synth.set_note_on(chord_note + capo, velocity if velocity <= 127 else 127, channel)
-                synth._usb_midi[channel].send(NoteOff(0, channel=channel))		# THIS CODE IS NEEDED TO NOTE ON IMMEDIATELY
+                synth.set_note_on(chord_note + capo, velocity if velocity <= 127 else 127, channel, string, 5 - string)
             # Note off
             else:
-                synth.set_note_off(chord_note + capo, 0)
-                synth._usb_midi[channel].send(NoteOff(0, channel=channel))		# THIS CODE IS NEEDED TO NOTE ON IMMEDIATELY
+                synth.set_note_off(chord_note + capo, channel)
+
+        if alloc_accounting:
+            scan_timing.add_alloc(_ALLOC_NOTE, gc.mem_alloc() - start_alloc)
 
         return chord_note
 
 
     def play_chord(self, play=True, velocity=127, channel=None):
+        alloc_accounting = scan_timing.alloc_accounting()
+        if alloc_accounting:
+            start_alloc = gc.mem_alloc()
+
         capo = self.capotasto()
-        notes_in_chord = self.chord_notes()        
+        notes_in_chord = self._voicing
         if channel is None:
             channel = self.midi_channel()
 
         # Play a chord selected
         if play:
+            if latency_tracer.enabled():
+                for note in notes_in_chord:
+                    if note >= 0:
+                        latency_tracer.trace(_TRACE_RESOLVED, 7, _MIDI_NOTE_ON | channel, note + capo)
+
 #            print('CHORD NOTEs ON : ', notes_in_chord)
             velocity = velocity + self.offset_velocity()
             if velocity > 127:
                 velocity = 127
                 
-            count_nt = 0
-            for nt in notes_in_chord:
-                if nt >= 0:
-                    synth.set_note_on(nt + capo, velocity, channel)
-                    synth._usb_midi[channel].send(NoteOff(0, channel=channel))	# THIS CODE IS NEEDED TO NOTE ON IMMEDIATELY
-                    count_nt = count_nt + 1
-                    sleep(0.005)
+            # All notes in a single write (no wait between notes)
+            if self._strum_spacing == 0:
+                synth.notes_send(_MIDI_NOTE_ON, notes_in_chord, capo, velocity, channel, 7)
 
-            if count_nt % 2 == 1:											# THIS CODE IS NEEDED TO NOTE ON IMMEDIATELY
-                synth._usb_midi[channel].send(NoteOff(0, channel=channel))	# THIS CODE IS NEEDED TO NOTE ON IMMEDIATELY
+            # Strum, the notes are played by the strum task
+            else:
+                self.strum(notes_in_chord, capo, velocity, channel)
 
         # Notes in chord off
         else:
             # Notes off
 #            print('CHORD NOTEs OFF: ', notes_in_chord)
-            count_nt = 0
-            for nt in notes_in_chord:
-                if nt >= 0:
-                    synth.set_note_off(nt + capo, 0)
-                    synth._usb_midi[channel].send(NoteOff(0, channel=channel))	# THIS CODE IS NEEDED TO NOTE ON IMMEDIATELY
-                    count_nt = count_nt + 1
-                    sleep(0.005)
+            self._strum_size = 0
+            synth.notes_send(_MIDI_NOTE_OFF, notes_in_chord, capo, 0, channel)
+
+        if alloc_accounting:
+            scan_timing.add_alloc(_ALLOC_NOTE, gc.mem_alloc() - start_alloc)
+
+    # Start a strum of the notes (-1 is no note) plus offset, the first note is sent now.
+    # A strum in progress is cut off.
+    def strum(self, notes, offset, velocity, channel):
+        direction = self._strum_direction
+        if direction == _STRUM_VELOCITY:
+            down = velocity >= STRUM_VELOCITY_DOWN
+        elif direction == _STRUM_ALTERNATE:
+            down = not self._strum_down
+        else:
+            down = direction == _STRUM_DOWN
+
+        self._strum_down = down
+
+        # Down: on-note, 6th string, ..., 1st string / Up: 1st string, ..., 6th string, on-note
+        size = 0
+        for index in range(7):
+            string = 6 - index if down else index
+            note = notes[string]
+            if note >= 0:
+                self._strum_keys[size] = note + offset
+                self._strum_strings[size] = string
+                string_velocity = velocity - self._strum_taper * size
+                self._strum_velocities[size] = string_velocity if string_velocity > 0 else 1
+                size = size + 1
+
+        self._strum_channel = channel
+        self._strum_ticks = supervisor.ticks_ms()
+        self._strum_next = 0
+        self._strum_size = size
+        self.strum_step(self._strum_ticks)
+
+    # Send the notes of the strum in progress when their time comes,
+    # returns msec to the next note (-1 is no strum in progress)
+    def strum_step(self, current_ticks):
+        while self._strum_next < self._strum_size:
+            wait = self._strum_next * self._strum_spacing - ticks_diff(current_ticks, self._strum_ticks)
+            if wait > 0:
+                return wait
+
+            synth.key_send(_MIDI_NOTE_ON, self._strum_keys[self._strum_next], self._strum_velocities[self._strum_next], self._strum_channel, self._strum_strings[self._strum_next], 7, current_ticks)
+            self._strum_next = self._strum_next + 1
+
+        return -1
+
+    # Release mode: let ring (False) or mute (True)
+    def release_mute(self, turn_on=None):
+        if turn_on is not None:
+            self._release_mute = turn_on
+
+        return self._release_mute
+
+    # A pad is released, the notes played by the pad are turned off in the mute mode
+    def release_pad(self, pad):
+        if self._release_mute:
+            if pad == 7:
+                self._strum_size = 0
+
+            synth.voices_release(pad)
+
+    # Strum direction (_STRUM_DOWN, _STRUM_UP, _STRUM_VELOCITY, _STRUM_ALTERNATE)
+    def strum_direction(self, direction=None):
+        if direction is not None:
+            self._strum_direction = direction % len(STRUM_DIRECTION_NAMES)
+
+        return self._strum_direction
+
+    # Time in msec between the strings in a strum
+    def strum_spacing(self, msec=None):
+        if msec is not None:
+            self._strum_spacing = msec if msec > 0 else 0
 
-            if count_nt % 2 == 1:											# THIS CODE IS NEEDED TO NOTE ON IMMEDIATELY
-                synth._usb_midi[channel].send(NoteOff(0, channel=channel))	# THIS CODE IS NEEDED TO NOTE ON IMMEDIATELY
+        return self._strum_spacing
+
+    # Velocity decrease for each string in a strum
+    def strum_taper(self, taper=None):
+        if taper is not None:
+            self._strum_taper = taper if taper > 0 else 0
+
+        return self._strum_taper
 
     def show_info(self, param, color):
         if param == self.PARAM_ALL:
@@ -1286,6 +3612,18 @@ class Guitar_class:
                 for y in list(range(3)):
                     self._display.show_message(st[y], 80 + i * 8, 9 + y * 9, color)
 
+        # Chord of the notes sounding
+        if param == self.PARAM_ALL or param == self.PARAM_GUITAR_SOUNDING:
+            mask = synth.pitch_classes()
+            chord = self.chord_recognize(mask)
+            if chord >= 0:
+                st = '>' + self.chord_name(0, chord >> 8, chord & 0xff)[1]
+            else:
+                st = '>--' if mask != 0 else ''
+
+            self._display.fill_rect(0, 27, 72, 9, 0 if color == 1 else 1)
+            self._display.text(st[0:12], 0, 27, color)
+
         self._display.show()
 
     def show_info_settings(self, param, color):
@@ -1314,11 +3652,11 @@ class Guitar_class:
     def show_info_config1(self, param, color):
         if param == self.PARAM_ALL:
             self._display.show_message('--GUITAR CONFIG1--', 0, 0, color)
-            self._display.show_message('VELOC OFFSET: {:d}'.format(self.offset_velocity()), 0, 9, color)
-            self._display.show_message('VELOC CURVE : {:3.1f}'.format(adc0.velocity_curve()), 0, 18, color)
-            self._display.show_message('P-BEND RANGE:{:+d}'.format(self.pitch_bend_range()), 0, 27, color)
-            self._display.show_message('MODULA LVL01: {:d}'.format(self.chorus_level()), 0, 36, color)
-            self._display.show_message('MODULA LVL02: {:d}'.format(self.chorus_feedback()), 0, 45, color)
+            self._display.show_message('CC INTERVAL : ' + ('OFF' if synth.controller_interval() == 0 else '{:d}ms'.format(synth.controller_interval())), 0, 9, color)
+            self._display.show_message('VELOC OFFSET: {:d}'.format(self.offset_velocity()), 0, 18, color)
+            self._display.show_message('VELOC CURVE : {:3.1f}'.format(adc0.velocity_curve()), 0, 27, color)
+            self._display.show_message('P-BEND RANGE:{:+d}'.format(self.pitch_bend_range()), 0, 36, color)
+            self._display.show_message('MODULA LVL  : {:d}/{:d}'.format(self.chorus_level(), self.chorus_feedback()), 0, 45, color)
             self._display.show_message('AFT-TOUCH ON: {:3.1f}'.format(adc0.after_touch_counter() / 1000.0), 0, 54, color)
 
         self._display.show()
@@ -1342,6 +3680,39 @@ class Guitar_class:
 
         self._display.show()
 
+    def show_info_config3(self, param, color):
+        if param == self.PARAM_ALL:
+            self._display.show_message('--GUITAR CONFIG3--', 0, 0, color)
+            self._display.show_message('STRIKE WINDOW: {:d}ms'.format(adc0.strike_window()), 0, 9, color)
+            self._display.show_message('PAD CALIBRATED: ' + ('YES' if adc0.is_calibrated() else 'NO'), 0, 18, color)
+            if adc0.crosstalk_learning():
+                crosstalk = 'LEARN'
+            elif adc0.crosstalk_learned():
+                crosstalk = 'LEARNED'
+            elif adc0.crosstalk_ratio() == 0:
+                crosstalk = 'OFF'
+            else:
+                crosstalk = str(adc0.crosstalk_ratio()) + '%'
+
+            self._display.show_message('CROSSTALK CUT : ' + crosstalk, 0, 27, color)
+            self._display.show_message('HOLDOFF TIME  : {:d}ms'.format(adc0.holdoff_time()), 0, 36, color)
+            self._display.show_message('ADC RECORD    : ' + adc0.record_status(), 0, 45, color)
+            self._display.show_message('LATENCY TRACE : ' + ('ON' if latency_tracer.enabled() else 'OFF'), 0, 54, color)
+
+        self._display.show()
+
+    def show_info_config4(self, param, color):
+        if param == self.PARAM_ALL:
+            self._display.show_message('--GUITAR CONFIG4--', 0, 0, color)
+            self._display.show_message('STRUM DIR  : ' + STRUM_DIRECTION_NAMES[self.strum_direction()], 0, 9, color)
+            self._display.show_message('STRUM SPACE: {:d}ms'.format(self.strum_spacing()), 0, 18, color)
+            self._display.show_message('STRUM TAPER: {:d}'.format(self.strum_taper()), 0, 27, color)
+            self._display.show_message('VOICES: {:d} '.format(synth.polyphony()) + VOICE_STEAL_NAMES[synth.voice_steal()], 0, 36, color)
+            self._display.show_message('RELEASE    : ' + ('MUTE' if self.release_mute() else 'LET RING'), 0, 45, color)
+            self._display.show_message('TUNING     : ' + self.tuning_name()[0:8], 0, 54, color)
+
+        self._display.show()
+
     def show_info_music(self, param, color):
         if param == self.PARAM_ALL:
             self._display.show_message('--GUITAR MUSIC--', 0, 0, color)
@@ -1367,6 +3738,36 @@ class Guitar_class:
 
         self._display.show()
 
+    def show_info_timing(self, param, color):
+        if param == self.PARAM_ALL:
+            self._display.show_message('--SCAN TIMING--', 0, 0, color)
+            for kind, name, y in ((_SCAN_TIMING_SCAN, 'SCAN', 9), (_SCAN_TIMING_GAP, 'GAP ', 18)):
+                count, min_msec, mean10, max_msec = scan_timing.stats(kind)
+                self._display.show_message(name + ':{:d}/{:d}.{:d}/{:d}ms'.format(min_msec, mean10 // 10, mean10 % 10, max_msec), 0, y, color)
+
+            # Histogram bars in log2 scale
+            histogram = scan_timing.histogram(self._timing_histogram)
+            self._display.show_message('HIST ' + ('SCAN' if self._timing_histogram == _SCAN_TIMING_SCAN else 'GAP') + ' N={:d}'.format(scan_timing.stats(self._timing_histogram)[0]), 0, 27, color)
+            self._display.fill_rect(0, 45, 128, 9, 0 if color == 1 else 1)
+            max_bits = max(histogram).bit_length()
+            if max_bits > 0:
+                for bucket in range(len(histogram)):
+                    height = 8 * histogram[bucket].bit_length() // max_bits
+                    if height > 0:
+                        self._display.fill_rect(bucket * 9, 53 - height, 7, height, color)
+
+            # Pad triggers rejected as crosstalk (XT) and retriggers suppressed (RT)
+            chatter, holdoff = adc0.retrigger_suppressed()
+            self._display.show_message('REJECT XT:{:d} RT:{:d}'.format(adc0.crosstalk_rejected(), chatter + holdoff), 0, 36, color)
+
+            # Maximum bytes allocated in a scan cycle and a note event
+            if scan_timing.alloc_accounting():
+                self._display.show_message('ALLOC S:{:d}B N:{:d}B'.format(scan_timing.alloc_stats(_ALLOC_SCAN)[3], scan_timing.alloc_stats(_ALLOC_NOTE)[3]), 0, 54, color)
+            else:
+                self._display.show_message('ALLOC: OFF', 0, 54, color)
+
+        self._display.show()
+
     def do_task(self):
         bank = self.chord_bank() * 6
         if input_device.device_info('GUITAR_CHORD1') == False:
@@ -1397,6 +3798,29 @@ class Guitar_class:
             self.chord_bank(self.chord_bank() + 1)
             self.show_info(self.PARAM_GUITAR_CHORDSET, 1)
 
+    # Name the chord of the notes sounding, called from the async task show_sounding_chord().
+    # The display is updated at intervals not to delay scanning, the notes changed meanwhile (dirty)
+    # are shown once the interval has passed.  Returns the time to wait for the next call (msec).
+    def sounding_chord_step(self, current_ticks):
+        if application.screen_mode() != application.PLAY_GUITAR:
+            return CHORD_RECOGNIZE_POLL
+
+        if synth.pitch_classes() != self._pitch_classes_shown:
+            self._pitch_classes_dirty = True
+
+        if not self._pitch_classes_dirty:
+            return CHORD_RECOGNIZE_POLL
+
+        wait = CHORD_RECOGNIZE_INTERVAL - ticks_diff(current_ticks, self._pitch_classes_ticks)
+        if wait > 0:
+            return wait
+
+        self._pitch_classes_dirty = False
+        self._pitch_classes_shown = synth.pitch_classes()
+        self._pitch_classes_ticks = current_ticks
+        self.show_info(self.PARAM_GUITAR_SOUNDING, 1)
+        return CHORD_RECOGNIZE_POLL
+
     def do_task_settings(self):
         current_button = self.chord_on_button()
         
@@ -1439,7 +3863,13 @@ class Guitar_class:
             self.show_info_settings(self.PARAM_ALL, 1)
 
     def do_task_config1(self):
-        if   input_device.device_info('GUITAR_BASE_VOLUME') == False:
+        # Minimum interval of the continuous controllers
+        if   input_device.device_info('GUITAR_CC_INTERVAL') == False:
+            val = synth.controller_interval() + 10
+            synth.controller_interval(val if val <= 50 else 0)
+            self.show_info_config1(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_BASE_VOLUME') == False:
             self.offset_velocity(self.offset_velocity() + 10)
             self.show_info_config1(self.PARAM_ALL, 1)
             
@@ -1508,6 +3938,105 @@ class Guitar_class:
             self._drum_set[self._current_drum] = (self._drum_set[self._current_drum] + 1) % 48
             self.show_info_config2(self.PARAM_GUITAR_DRUM_NAME, 1)
 
+    def do_task_config3(self):
+        if input_device.device_info('GUITAR_STRIKE_WINDOW') == False:
+            val = adc0.strike_window() + 1
+            if val > 10:
+                val = 0
+
+            adc0.strike_window(val)
+            self.show_info_config3(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_CALIBRATE') == False:
+            self._display.show_message('CALIBRATING...', 0, 18, 1)
+            self._display.show()
+            adc0.calibrate()
+            adc0.save_calibration(PAD_CALIBRATION_FILE)
+            self.show_info_config3(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_CROSSTALK') == False:
+            # OFF -> 10% -> ... -> 50% -> LEARN -> LEARNED (saved) -> OFF
+            if adc0.crosstalk_learning():
+                adc0.crosstalk_learning(False)
+                adc0.save_calibration(PAD_CALIBRATION_FILE)
+            elif adc0.crosstalk_learned():
+                adc0.crosstalk_ratio(0)
+                adc0.save_calibration(PAD_CALIBRATION_FILE)
+            elif adc0.crosstalk_ratio() >= 50:
+                adc0.crosstalk_learning(True)
+            else:
+                adc0.crosstalk_ratio(adc0.crosstalk_ratio() + 10)
+
+            self.show_info_config3(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_HOLDOFF') == False:
+            val = adc0.holdoff_time() + 10
+            if val > 100:
+                val = 0
+
+            adc0.holdoff_time(val)
+            adc0.save_calibration(PAD_CALIBRATION_FILE)
+            self.show_info_config3(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_ADC_RECORD') == False:
+            if adc0.record_status() == 'OFF':
+                adc0.record_start()
+                self.show_info_config3(self.PARAM_ALL, 1)
+            else:
+                saved = adc0.record_stop(ADC_CAPTURE_FILE)
+                self.show_info_config3(self.PARAM_ALL, 1)
+                self._display.show_message('ADC RECORD    : ' + ('SAVED' if saved else 'NOT SAVED'), 0, 45, 1)
+                self._display.show()
+
+        elif input_device.device_info('GUITAR_LATENCY_TRACE') == False:
+            if not latency_tracer.enabled():
+                latency_tracer.enable(True)
+                self.show_info_config3(self.PARAM_ALL, 1)
+            else:
+                latency_tracer.enable(False)
+                saved = latency_tracer.save(LATENCY_TRACE_FILE)
+                self.show_info_config3(self.PARAM_ALL, 1)
+                self._display.show_message('LATENCY TRACE : ' + ('SAVED' if saved else 'NOT SAVED'), 0, 54, 1)
+                self._display.show()
+
+    def do_task_config4(self):
+        if input_device.device_info('GUITAR_STRUM_DIRECTION') == False:
+            self.strum_direction(self.strum_direction() + 1)
+            self.show_info_config4(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_STRUM_SPACING') == False:
+            val = self.strum_spacing() + 5
+            if val > 40:
+                val = 0
+
+            self.strum_spacing(val)
+            self.show_info_config4(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_STRUM_TAPER') == False:
+            val = self.strum_taper() + 2
+            if val > 16:
+                val = 0
+
+            self.strum_taper(val)
+            self.show_info_config4(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_POLYPHONY') == False:
+            index = VOICE_POLYPHONY.index(synth.polyphony()) + 1 if synth.polyphony() in VOICE_POLYPHONY else 0
+            synth.polyphony(VOICE_POLYPHONY[index % len(VOICE_POLYPHONY)])
+            self.show_info_config4(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_VOICE_STEAL') == False:
+            synth.voice_steal(synth.voice_steal() + 1)
+            self.show_info_config4(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_RELEASE') == False:
+            self.release_mute(not self.release_mute())
+            self.show_info_config4(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_TUNING') == False:
+            self.tuning(self.tuning() + 1)
+            self.show_info_config4(self.PARAM_ALL, 1)
+
     def do_task_music(self):
         if   input_device.device_info('GUITAR_CHORD_NEXT') == False:
             self.music_chord(self.music_chord() + 1)
@@ -1532,6 +4061,29 @@ class Guitar_class:
         elif input_device.device_info('GUITAR_CHORD_LAST') == False:
             self.music_chord(-1)
             self.show_info_music(self.PARAM_MUSIC_INFO, 1)
+
+    def do_task_timing(self):
+        if   input_device.device_info('GUITAR_TIMING_REFRESH') == False:
+            self.show_info_timing(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_TIMING_HISTOGRAM') == False:
+            self._timing_histogram = _SCAN_TIMING_GAP if self._timing_histogram == _SCAN_TIMING_SCAN else _SCAN_TIMING_SCAN
+            self.show_info_timing(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_TIMING_RESET') == False:
+            scan_timing.reset()
+            adc0.counters_reset()
+            synth.controller_stats_reset()
+            self.show_info_timing(self.PARAM_ALL, 1)
+
+        elif input_device.device_info('GUITAR_TIMING_DUMP') == False:
+            scan_timing.dump()
+            adc0.dump()
+            synth.midi_dump()
+
+        elif input_device.device_info('GUITAR_TIMING_ALLOC') == False:
+            scan_timing.alloc_accounting(not scan_timing.alloc_accounting())
+            self.show_info_timing(self.PARAM_ALL, 1)
         
 ################# End of Guitar Class Definition #################
  
@@ -1550,7 +4102,10 @@ class Application_class:
         self.GUITAR_SETTINGS = 1
         self.GUITAR_CONFIG1 = 2
         self.GUITAR_CONFIG2 = 3
-        self.PLAY_MUSIC = 4
+        self.GUITAR_CONFIG3 = 4
+        self.GUITAR_CONFIG4 = 5
+        self.PLAY_MUSIC = 6
+        self.SCAN_TIMING = 7
         self._screen_mode = self.PLAY_GUITAR
 
         # Device aliases
@@ -1583,7 +4138,7 @@ class Application_class:
 
     def screen_mode(self, inst_num=None):
         if inst_num is not None:
-            self._screen_mode = inst_num % 5
+            self._screen_mode = inst_num % 8
             
         return self._screen_mode
 
@@ -1601,9 +4156,18 @@ class Application_class:
         elif sc_mode == self.GUITAR_CONFIG2:
             instrument_guitar.show_info_config2(param, 1)
             
+        elif sc_mode == self.GUITAR_CONFIG3:
+            instrument_guitar.show_info_config3(param, 1)
+            
+        elif sc_mode == self.GUITAR_CONFIG4:
+            instrument_guitar.show_info_config4(param, 1)
+            
         elif sc_mode == self.PLAY_MUSIC:
             instrument_guitar.show_info_music(param, 1)
 
+        elif sc_mode == self.SCAN_TIMING:
+            instrument_guitar.show_info_timing(param, 1)
+
     # Application task called from asyncio, never call this directly.
     def do_task(self):
         # Screen mode change
@@ -1621,9 +4185,18 @@ class Application_class:
             elif sc_mode == self.GUITAR_CONFIG2:
                 instrument_guitar.setup_config2()
                 
+            elif sc_mode == self.GUITAR_CONFIG3:
+                instrument_guitar.setup_config3()
+                
+            elif sc_mode == self.GUITAR_CONFIG4:
+                instrument_guitar.setup_config4()
+                
             elif sc_mode == self.PLAY_MUSIC:
                 instrument_guitar.setup_music()
 
+            elif sc_mode == self.SCAN_TIMING:
+                instrument_guitar.setup_timing()
+
             display.fill(0)
             self.show_info()
 
@@ -1644,10 +4217,22 @@ class Application_class:
         elif sc_mode == self.GUITAR_CONFIG2:
             instrument_guitar.do_task_config2()
 
+        # Guitar configs
+        elif sc_mode == self.GUITAR_CONFIG3:
+            instrument_guitar.do_task_config3()
+
+        # Guitar configs
+        elif sc_mode == self.GUITAR_CONFIG4:
+            instrument_guitar.do_task_config4()
+
         # Play a music
         elif sc_mode == self.PLAY_MUSIC:
             instrument_guitar.do_task_music()
 
+        # Scan timing (debug)
+        elif sc_mode == self.SCAN_TIMING:
+            instrument_guitar.do_task_timing()
+
 
 ################# End of Application Class Definition #################
         
@@ -1684,6 +4269,13 @@ def setup():
             pico_led.value = True
             sleep(1.0)
 
+    # Pad calibration, calibrate pads at rest and save it if there is no calibration file
+    if not adc0.load_calibration(PAD_CALIBRATION_FILE):
+        display.text('Calibrating pads', 15, 50, 0)
+        display.show()
+        adc0.calibrate()
+        adc0.save_calibration(PAD_CALIBRATION_FILE)
+
     # USB MIDI Device
     synth = USB_MIDI_Instrument_class()
     synth.set_all_notes_off()
@@ -1715,12 +4307,18 @@ async def main():
     interrupt_task8 = asyncio.create_task(catch_pin_transitions(board.GP5,  'BUTTON_8', input_device.button_pressed, input_device.button_released))
 
     interrupt_adc0  = asyncio.create_task(catch_adc_voltage(adc0))
+    interrupt_serial = asyncio.create_task(catch_serial_command())
+    midi_output = asyncio.create_task(send_midi_output(synth))
+    strum = asyncio.create_task(play_strum(instrument_guitar))
+    sounding_chord = asyncio.create_task(show_sounding_chord(instrument_guitar))
 
-    await asyncio.gather(interrupt_task1, interrupt_task2, interrupt_task3, interrupt_task4, interrupt_adc0)
+    await asyncio.gather(interrupt_task1, interrupt_task2, interrupt_task3, interrupt_task4, interrupt_adc0, interrupt_serial, midi_output, strum, sounding_chord)
 
 ######### MAIN ##########
 if __name__=='__main__':
     adc0 = ADC_Device_class(A0, 'ADC0')
+    scan_timing = Scan_Timing_class()
+    latency_tracer = Latency_Tracer_class()
     # Setup
     pico_led = None
     
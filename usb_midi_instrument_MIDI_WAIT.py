@@ -219,6 +219,14 @@ def ticks_less(ticks1, ticks2):
     "Return true iff ticks1 is less than ticks2, assuming that they are within 2**28 ticks"
     return ticks_diff(ticks1, ticks2) < 0
 
+# Raw ADC values are quantized to 12 bits (RP2040 ADC resolution) to index the lookup tables
+_ADC_TABLE_SHIFT = const(4)
+_ADC_TABLE_SIZE = const(65536 >> _ADC_TABLE_SHIFT)
+
+# Pad states in the lookup tables except velocity (1..127)
+_ADC_RELEASED = const(0)
+_ADC_HOLD = const(255)
+
 class ADC_Device_class:
     def __init__(self, adc_pin, adc_name):
         self._adc = AnalogIn(adc_pin)
@@ -237,6 +245,10 @@ class ADC_Device_class:
         
         self._velocity_curve = 2.7
 
+        # Raw ADC value to pad state lookup tables (one table per pad, pads with the same gate share it)
+        self._velocity_table = [None] * 8
+        self.make_velocity_tables()
+
     def adc(self):
         return self._adc
 
@@ -251,15 +263,78 @@ class ADC_Device_class:
                 curve = 1.5
                 
             self._velocity_curve = curve
+            self.make_velocity_tables()
 
         return self._velocity_curve
 
-    def get_voltage(self, analog_channel):
+    # Voltage gate (on, off) of a pad
+    def voltage_gate(self, pad, gate=None):
+        if gate is not None:
+            self._voltage_gate[pad] = gate
+            self.make_velocity_tables()
+
+        return self._voltage_gate[pad]
+
+    # Velocity curve applied to a voltage (0.0..5000.0)
+    def curved_voltage(self, voltage):
+        velo_curve = self._velocity_curve
+        voltage = (math.pow(velo_curve, voltage) - 1) / math.pow(velo_curve, 5) * 10000.0
+        if voltage > 5000.0:
+            voltage = 5000.0
+
+        return voltage
+
+    # Make a lookup table from a quantized raw ADC value to a pad state
+    #   _ADC_RELEASED: Pad is released
+    #   _ADC_HOLD    : Between the off and on voltages (keep the current state)
+    #   1..127       : Pad is tapped, the value is the velocity
+    #   The table ends at the level where the curved voltage saturates at 5000.0,
+    #   higher levels must use the last element.
+    def make_velocity_table(self, gate):
+        (pass_voltage, off_voltage) = gate
+        table = bytearray(self._velocity_table_top + 1)
+        for level in range(self._velocity_table_top + 1):
+            voltage = self.curved_voltage((level << _ADC_TABLE_SHIFT) * 5.0 / 65535)
+
+            # Pad is released
+            if   voltage <= off_voltage:
+                table[level] = _ADC_RELEASED
+
+            # Pad is tapped
+            elif voltage >= pass_voltage:
+                velocity = int((voltage - pass_voltage) * 128.0 * 3.0 / (5000.0 - pass_voltage)) + 30
+                table[level] = velocity if velocity <= 127 else 127
+
+            else:
+                table[level] = _ADC_HOLD
+
+        return table
+
+    # Rebuild the lookup tables, call this whenever the velocity curve or a voltage gate changes
+    def make_velocity_tables(self):
+        # The lowest level where the curved voltage saturates (curve^v - 1 = curve^5 / 2)
+        velo_curve = self._velocity_curve
+        level = int(math.log(1 + math.pow(velo_curve, 5) / 2) / math.log(velo_curve) * 65535 / 5.0) >> _ADC_TABLE_SHIFT
+        self._velocity_table_top = level + 1 if level + 1 < _ADC_TABLE_SIZE else _ADC_TABLE_SIZE - 1
+
+        tables = {}
+        for pad in range(8):
+            gate = self._voltage_gate[pad]
+            if gate not in tables:
+                tables[gate] = self.make_velocity_table(gate)
+
+            self._velocity_table[pad] = tables[gate]
+
+    # Select an analog channel on 4051 and read the raw ADC value (0..65535)
+    def get_raw(self, analog_channel):
         self._4051_selectors[0].value =  analog_channel & 0x1
         self._4051_selectors[1].value = (analog_channel & 0x2) >> 1
         self._4051_selectors[2].value = (analog_channel & 0x4) >> 2
 #        sleep(0.01)
-        voltage = self._adc.value * 5.0 / 65535
+        return self._adc.value
+
+    def get_voltage(self, analog_channel):
+        voltage = self.get_raw(analog_channel) * 5.0 / 65535
         return voltage
 
     def adc_handler(self):
@@ -269,14 +344,11 @@ class ADC_Device_class:
 #SOS#            if self._note_on_ticks[string] >= 0:
 #SOS#                from_note_on[string] = ticks_diff(current_ticks, self._note_on_ticks[string])
 
-        # Get voltages guitar strings
-        velo_curve = self.velocity_curve()
-        velo_factor = math.pow(velo_curve, 5)
+        # Get pad states of guitar strings from the raw ADC values
+        table_top = self._velocity_table_top
         for string in list(range(8)):
-            voltage = self.get_voltage(string)
-            voltage = (math.pow(velo_curve, voltage) - 1) / velo_factor * 10000.0
-            if voltage > 5000.0:
-                voltage = 5000.0
+            level = self.get_raw(string) >> _ADC_TABLE_SHIFT
+            velocity = self._velocity_table[string][level if level < table_top else table_top]
 
             # Note on time out
 #SOS#            if from_note_on[string] >= 3000:
@@ -310,7 +382,7 @@ class ADC_Device_class:
 #SOS#            elif voltage <= self._voltage_gate[string][1]:
 
             # Pad is released
-            if   voltage <= self._voltage_gate[string][1]:
+            if   velocity == _ADC_RELEASED:
 #                print('PAD RELEASED:', string, voltage)
                 #Note a string off
                 if string <= 5:
@@ -338,13 +410,8 @@ class ADC_Device_class:
                         print('PITCH BEND off')
                         
             # Pad is tapped
-            elif voltage >= self._voltage_gate[string][0] and self._adc_on[string] == False:
-                pass_voltage = self._voltage_gate[string][0]
-                print('PAD PRESSED:', string, voltage)
-                # velocity
-                velocity = int((voltage - pass_voltage) * 128.0 * 3.0 / (5000.0 - pass_voltage)) + 30
-                if velocity > 127:
-                    velocity = 127
+            elif velocity != _ADC_HOLD and self._adc_on[string] == False:
+                print('PAD PRESSED:', string, velocity)
                 
                 # Play a string
                 if string <= 5:
@@ -363,7 +430,7 @@ class ADC_Device_class:
                         synth.set_pitch_bend( 8192, 0)
                         self._adc_on[6] = False                    
 
-                    print('PLAY a STRING:', 5 - string, voltage, velocity)
+                    print('PLAY a STRING:', 5 - string, velocity)
                     self._note_on[string] = True
 #SOS#                    self._note_on_ticks[string] = current_ticks
                     chord_note = instrument_guitar.play_a_string(5 - string, velocity)
@@ -385,7 +452,7 @@ class ADC_Device_class:
                         synth.set_pitch_bend( 8192, 0)
                         self._adc_on[6] = False                    
                         
-                    print('PLAY CHORD:', voltage, velocity)
+                    print('PLAY CHORD:', velocity)
                     instrument_guitar.play_chord(True, velocity)
                     self._play_chord = True
 #SOS#                    self._note_on_ticks[string] = current_ticks
@@ -403,7 +470,7 @@ class ADC_Device_class:
                         print('PITCH BEND OFF')
 
                     bend_velocity = 9000 + int((7000 / 127) * velocity)
-                    print('PITCH BEND ON:', bend_velocity, voltage, velocity)
+                    print('PITCH BEND ON:', bend_velocity, velocity)
                     synth.set_pitch_bend(bend_velocity, 0)
                     self._note_on[string] = True
 #SOS#                    self._note_on_ticks[string] = current_ticks